@@ -1,22 +1,66 @@
 import os
+import io
+import sys
+import gc
+import json
 import random
+import time
 import math
+import numpy as np
 import pygame
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from os import listdir
 from os.path import isfile, join
 
-# Initialize pygame and the sound mixer for music/sfx
-pygame.init()
-pygame.mixer.init()
-
-pygame.display.set_caption("Platformer")
+# Headless mode (AYA_HEADLESS=1 or --headless): no window and no audio, for
+# running simulations on servers without a display
+HEADLESS = os.environ.get("AYA_HEADLESS") == "1" or "--headless" in sys.argv
 
 # Global constants for screen size and frame rate
 WIDTH, HEIGHT = 1000, 800
-FPS = 60
+FPS = 60 # Game logic always runs at this many steps a second
 PLAYER_VEL = 5
-
-window = pygame.display.set_mode((WIDTH, HEIGHT))
+# Most logic steps run for one rendered frame when the game falls behind.
+# Past that the game slows down instead of trying to catch up
+MAX_FRAME_SKIP = 5
+
+# Native resolution mode (--native or AYA_NATIVE=1): sprites and tiles stay at
+# their 1x size and the world is drawn to a half-size surface that is scaled
+# up once a frame. PIXEL is how many world pixels one drawn pixel covers.
+# Positions, rects and collision masks are in world pixels either way, so
+# the game plays exactly the same in both modes
+NATIVE = os.environ.get("AYA_NATIVE") == "1" or "--native" in sys.argv
+PIXEL = 2 if NATIVE else 1
+
+# The game window. Importing this module doesn't touch pygame; the window is
+# opened by init(), which everything that needs the display calls first
+window = None
+
+
+# Initialize pygame and the sound mixer for music/sfx, and open the window.
+# Safe to call again, later calls just return the window
+def init(headless=None, native=None):
+    global window, HEADLESS, NATIVE, PIXEL
+    if window is not None:
+        return window
+    if headless is not None:
+        HEADLESS = headless
+    if native is not None:
+        NATIVE = native
+        PIXEL = 2 if native else 1
+    if HEADLESS:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+    pygame.init()
+    if not HEADLESS:
+        pygame.mixer.init()
+
+    pygame.display.set_caption("Platformer")
+    window = pygame.display.set_mode((WIDTH, HEIGHT))
+    return window
 
 
 # Helper function to flip images horizontally
@@ -25,22 +69,159 @@ def flip(sprites):
     return [pygame.transform.flip(sprite, True, False) for sprite in sprites]
 
 
-# This function loads sprite sheets from the assets folder
-# It splits a big image sheet into individual animation frames based on width/height
-def load_sprite_sheets(dir1, dir2, width, height, direction=False):
-    path = join("assets", dir1, dir2)
-    # Safety check: make sure the folder actually exists so the game doesn't crash
-    if not os.path.exists(path):
-        print(f"Error: Directory not found: {path}")
-        return {}
-        
-    images = [f for f in listdir(path) if isfile(join(path, f))]
+# One animation frame with its collision mask and rect worked out up front,
+# so entities can swap them in instead of scanning pixels every tick.
+# The mask and rect come from `world`, the frame at world scale, when the
+# image itself is smaller (native resolution mode)
+Frame = namedtuple("Frame", ["image", "mask", "rect"])
+
+
+def make_frame(surface, world=None):
+    world = world or surface
+    return Frame(surface, pygame.mask.from_surface(world), world.get_rect())
+
+
+# How many surfaces optimize_surface() put in each class
+surface_classes = {"opaque": 0, "colorkey": 0, "alpha": 0}
+# Colorkeys to try, in order, until one isn't used by the image itself
+COLORKEYS = [(255, 0, 255), (0, 255, 255), (1, 2, 3)]
+
+
+# Picks the cheapest way to blit a surface. Fully opaque ones become plain
+# display-format surfaces, ones where every pixel is either fully see-through
+# or fully solid (most pixel art) get a colorkey with RLE, and only images
+# with soft edges keep per-pixel alpha. Masks should be made from the
+# original surface, before this
+def optimize_surface(surface):
+    init()
+    if surface.get_masks()[3] == 0:
+        kind, result = "opaque", surface.convert()
+    else:
+        alpha = pygame.surfarray.array_alpha(surface)
+        kind, result = "alpha", None
+        if alpha.min() == 255:
+            kind, result = "opaque", surface.convert()
+        elif np.isin(alpha, (0, 255)).all():
+            colors = pygame.surfarray.array3d(surface)[alpha == 255]
+            key = next((key for key in COLORKEYS if not (colors == key).all(axis=1).any()), None)
+            if key is not None:
+                kind, result = "colorkey", pygame.Surface(surface.get_size()).convert()
+                result.fill(key)
+                result.blit(surface, (0, 0))
+                result.set_colorkey(key, pygame.RLEACCEL)
+        if result is None:
+            result = surface.convert_alpha()
+    surface_classes[kind] += 1
+    return result
+
+
+# Where the processed sprite sheets are cached between launches
+ATLAS_DIR = ".atlas_cache"
+ATLAS_MAGIC = b"AYAATLS1"
+
+
+# Reads the JSON index at the start of an open atlas file, leaving the file
+# at the first pixel. None if it isn't a (complete) atlas
+def read_atlas_index(f):
+    header = f.read(12)
+    if len(header) < 12 or header[:8] != ATLAS_MAGIC:
+        return None
+    index_size = int.from_bytes(header[8:12], "little")
+    try:
+        index = json.loads(f.read(index_size))
+    except ValueError:
+        return None
+    return index if isinstance(index, dict) else None
+
+
+# Reads a packed atlas file in one go and rebuilds its surfaces.
+# Returns None if there is no cache, a source PNG changed since it was made
+# or the file is cut short or damaged (the sheets are then sliced again)
+def read_atlas(path, sources):
+    try:
+        with open(path, "rb") as f:
+            index = read_atlas_index(f)
+            if index is None or index.get("sources") != sources:
+                return None
+            pixels = memoryview(f.read())
+    except OSError:
+        return None
+
+    try:
+        frames = index["frames"]
+        if len(pixels) != sum(w * h * 4 for sheet in frames.values() for _, w, h in sheet):
+            return None
+        return {name: [pygame.image.frombuffer(pixels[offset:offset + w * h * 4], (w, h), "RGBA").convert_alpha()
+                       for offset, w, h in sheet]
+                for name, sheet in frames.items()}
+    except (KeyError, TypeError, ValueError):
+        return None
+
 
-    all_sprites = {}
+# True if the atlas at path is there and was made from these exact sources
+# (only its index is read)
+def atlas_current(path, sources):
+    try:
+        with open(path, "rb") as f:
+            index = read_atlas_index(f)
+    except OSError:
+        return False
+    return index is not None and index.get("sources") == sources
+
+
+# The atlas file for one set of load_sprite_sheets arguments
+def atlas_path(dir1, dir2, width, height, direction):
+    return join(ATLAS_DIR, f"{dir1}-{dir2}-{width}x{height}{'-lr' if direction else ''}"
+                           f"{'-1x' if PIXEL > 1 else ''}.atlas")
+
+
+# The sheet images in a sprite folder and their mtimes, which an atlas
+# records so it knows when it's out of date
+def sheet_sources(path):
+    images = sorted(f for f in listdir(path) if isfile(join(path, f)))
+    return images, {image: os.stat(join(path, image)).st_mtime_ns for image in images}
+
+
+# Packs every frame's pixels into one file, with a JSON index up front that
+# says where each frame starts and which source files (and mtimes) it came from
+def write_atlas(path, sources, sheets):
+    index = {"sources": sources, "frames": {}}
+    chunks = []
+    offset = 0
+    for name, frames in sheets.items():
+        index["frames"][name] = []
+        for surface in frames:
+            w, h = surface.get_size()
+            chunks.append(pygame.image.tobytes(surface, "RGBA"))
+            index["frames"][name].append([offset, w, h])
+            offset += w * h * 4
+    header = json.dumps(index).encode()
+    # Written to a temporary file that is then renamed over the atlas, so
+    # another process starting at the same time never reads half a file
+    temp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temp, "wb") as f:
+            f.write(ATLAS_MAGIC + len(header).to_bytes(4, "little") + header)
+            f.writelines(chunks)
+        os.replace(temp, path)
+    except OSError:
+        # Read-only install or similar: just slice the sheets again next time
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+
+
+# Cuts each sheet into frames of width x height and scales them up 2x (or
+# keeps them at 1x with scale=False). With direction=True every animation
+# gets _right and flipped _left versions
+def slice_sprite_sheets(path, images, width, height, direction, scale=True):
+    sheets = {}
 
     # Loop through every image file in the directory
     for image in images:
-        sprite_sheet = pygame.image.load(join(path, image)).convert_alpha()
+        sprite_sheet = assets.image(join(path, image))
 
         sprites = []
         # Cut the sheet into individual frames
@@ -48,34 +229,307 @@ def load_sprite_sheets(dir1, dir2, width, height, direction=False):
             surface = pygame.Surface((width, height), pygame.SRCALPHA, 32)
             rect = pygame.Rect(i * width, 0, width, height)
             surface.blit(sprite_sheet, (0, 0), rect)
-            sprites.append(pygame.transform.scale2x(surface))
+            sprites.append(pygame.transform.scale2x(surface) if scale else surface)
 
         # If direction is needed, we save both right (normal) and left (flipped) versions
         if direction:
-            all_sprites[image.replace(".png", "") + "_right"] = sprites
-            all_sprites[image.replace(".png", "") + "_left"] = flip(sprites)
+            sheets[image.replace(".png", "") + "_right"] = sprites
+            sheets[image.replace(".png", "") + "_left"] = flip(sprites)
         else:
-            all_sprites[image.replace(".png", "")] = sprites
+            sheets[image.replace(".png", "")] = sprites
 
-    return all_sprites
+    return sheets
 
 
-# Loads the terrain block image
+# This function loads sprite sheets from the assets folder
+# It splits a big image sheet into individual animation frames based on width/height
+# and returns them as Frames with their masks already built.
+# The sliced and scaled frames are cached in ATLAS_DIR, so later launches
+# skip the slicing (the cache rebuilds itself when a PNG's mtime changes).
+# In native resolution mode the images stay 1x; the masks still come from the
+# 2x frames, so collisions are the same as in the normal mode
+def load_sprite_sheets(dir1, dir2, width, height, direction=False, atlas=True):
+    path = join("assets", dir1, dir2)
+    # Safety check: make sure the folder actually exists so the game doesn't crash
+    if not os.path.exists(path):
+        print(f"Error: Directory not found: {path}")
+        return {}
+        
+    images, sources = sheet_sources(path)
+    init() # Surfaces are converted to the display format
+
+    sheets = None
+    if atlas:
+        cache = atlas_path(dir1, dir2, width, height, direction)
+        sheets = read_atlas(cache, sources)
+    if sheets is None:
+        sheets = slice_sprite_sheets(path, images, width, height, direction, scale=PIXEL == 1)
+        if atlas:
+            write_atlas(cache, sources, sheets)
+
+    if PIXEL == 1:
+        return {name: [make_frame(optimize_surface(s), s) for s in frames] for name, frames in sheets.items()}
+    return {name: [make_frame(optimize_surface(s), pygame.transform.scale2x(s)) for s in frames]
+            for name, frames in sheets.items()}
+
+
+# Loads the terrain block as a Frame (cut and scaled once, then shared by every
+# Block). In native resolution mode the image is the 1x tile
 def get_block(size):
-    path = join("assets", "Terrain.png")
-    image = pygame.image.load(path).convert_alpha()
-    surface = pygame.Surface((size, size), pygame.SRCALPHA, 32)
-    rect = pygame.Rect(0, 0, size, size)
-    surface.blit(image, (0, 0), rect)
-    return pygame.transform.scale2x(surface)
+    def load():
+        path = join("assets", "Terrain.png")
+        image = assets.image(path)
+        surface = pygame.Surface((size, size), pygame.SRCALPHA, 32)
+        rect = pygame.Rect(0, 0, size, size)
+        surface.blit(image, (0, 0), rect)
+        world = pygame.Surface((size, size), pygame.SRCALPHA, 32)
+        world.blit(pygame.transform.scale2x(surface), (0, 0))
+        if PIXEL == 1:
+            return make_frame(optimize_surface(world), world)
+        return make_frame(optimize_surface(surface.subsurface(0, 0, size // PIXEL, size // PIXEL)), world)
+
+    return assets.get(("block", size, PIXEL), load)
+
+
+# The trophy scaled to a size x size Frame (a gold square if the image is
+# missing), made once and shared by every Treasure
+def get_trophy(size):
+    def load():
+        world = pygame.Surface((size, size), pygame.SRCALPHA)
+        img = assets.image(join("assets", "trophy.png"), optional=True)
+        if img is not None:
+            # Scale image to fit the block size
+            world.blit(pygame.transform.scale(img, (size, size)), (0, 0))
+        else:
+            # Fallback: Gold square if no image found
+            world.fill((255, 215, 0))
+        image = world if PIXEL == 1 else pygame.transform.scale(world, (size // PIXEL, size // PIXEL))
+        return make_frame(optimize_surface(image), world)
+
+    return assets.get(("trophy", size, PIXEL), load)
+
+
+# Rough number of bytes an asset takes up, used by the cache's size budget
+def asset_size(value):
+    if value is None:
+        return 0
+    if isinstance(value, pygame.Surface):
+        return value.get_width() * value.get_height() * value.get_bytesize()
+    if isinstance(value, pygame.mask.Mask):
+        width, height = value.get_size()
+        return width * height // 8
+    if isinstance(value, pygame.mixer.Sound):
+        frequency, size, channels = pygame.mixer.get_init() or (44100, -16, 2)
+        return int(value.get_length() * frequency * channels * abs(size) // 8)
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(asset_size(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(asset_size(v) for v in value if not isinstance(v, pygame.Rect))
+    # Fonts and anything else: we can't see inside, so count a small fixed cost
+    return 4096
+
+
+# Process-wide cache so every image, sprite sheet, font and sound is only
+# decoded once. Entries are keyed, and the least recently used ones are
+# dropped when the total goes over max_bytes
+class AssetCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # key -> (value, size)
+        self.total_bytes = 0
+
+    def get(self, key, loader):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry[0]
+        value = loader()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        if key in self.entries:
+            self.total_bytes -= self.entries.pop(key)[1]
+        size = asset_size(value)
+        self.entries[key] = (value, size)
+        self.total_bytes += size
+        # Evict the oldest entries, but never the one we just added
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, old_size) = self.entries.popitem(last=False)
+            self.total_bytes -= old_size
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+    # Loads an image file. With optional=True a missing file gives None
+    # instead of an error (and the miss is cached too)
+    def image(self, path, convert=True, optional=False):
+        def load():
+            if optional and not isfile(path):
+                return None
+            init()
+            image = pygame.image.load(path)
+            return image.convert_alpha() if convert else image
+
+        return self.get(("image", path, convert), load)
+
+    # An image ready for blitting, run through optimize_surface. optional
+    # works the same as for image()
+    def sprite(self, path, optional=False):
+        def load():
+            image = self.image(path, convert=False, optional=optional)
+            return None if image is None else optimize_surface(image)
+
+        return self.get(("sprite", path), load)
+
+    def sheets(self, dir1, dir2, width, height, direction=False):
+        return self.get(("sheets", dir1, dir2, width, height, direction, PIXEL),
+                        lambda: load_sprite_sheets(dir1, dir2, width, height, direction))
+
+    def font(self, name, size):
+        def load():
+            init()
+            return pygame.font.SysFont(name, size)
+
+        return self.get(("font", name, size), load)
+
+    # Rendered (antialiased) text. The font object itself is part of the key
+    def text(self, font, text, color):
+        return self.get(("text", font, text, color), lambda: font.render(text, True, color))
+
+    def sound(self, path):
+        def load():
+            init()
+            return pygame.mixer.Sound(path)
+
+        return self.get(("sound", path), load)
+
+    # Raw bytes of a music file, so mixer.music can stream it from memory
+    def music(self, path):
+        def load():
+            with open(path, "rb") as f:
+                return f.read()
+
+        return self.get(("music", path), load)
+
+
+assets = AssetCache()
+# Rendered text lives in its own smaller cache so a run of changing numbers
+# (score, timer) can't push sprites out of the main one
+texts = AssetCache(max_bytes=2 * 1024 * 1024)
+
+
+# Sounds and sprite sheets the game uses, so they can be loaded up front
+MUSIC_PATH = "assets/sounds/background-music.mp3"
+SOUND_PATHS = {
+    "lose": "assets/sounds/lose.mp3",
+    "jump": "assets/sounds/jump.mp3",
+    "win": "assets/sounds/win.mp3",
+    "damage": "assets/sounds/damage.mp3",
+}
+SHEETS = [
+    ("MainCharacters", "Man", 32, 32, True),
+    ("MainCharacters", "bad_guy", 32, 32, True),
+    ("Traps", "Fire", 16, 32, False),
+]
+
+
+# Every file to decode before the game starts, as (kind, path) pairs. Sheets
+# with an up to date atlas are left out: they load from the atlas instead
+def asset_manifest():
+    images = [join("assets", "Terrain.png"), join("assets", "trophy.png")]
+    for dir1, dir2, width, height, direction in SHEETS:
+        path = join("assets", dir1, dir2)
+        if os.path.exists(path):
+            files, sources = sheet_sources(path)
+            if not atlas_current(atlas_path(dir1, dir2, width, height, direction), sources):
+                images += [join(path, f) for f in files]
+    jobs = [("image", path) for path in images if isfile(path)]
+    # Loaded with assets.sprite(), which wants them unconverted
+    sprites = [join("assets", "Background", "pink.png"), "assets/heart.png"]
+    jobs += [("sprite", path) for path in sprites if isfile(path)]
+    jobs += [("sound", path) for path in SOUND_PATHS.values()]
+    jobs.append(("music", MUSIC_PATH))
+    return jobs
+
+
+# Worker thread part of preloading: decoding doesn't need the display
+def decode_asset(kind, path):
+    if kind in ("image", "sprite"):
+        return pygame.image.load(path)
+    if kind == "sound":
+        return pygame.mixer.Sound(path)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def draw_loading_screen(win, progress):
+    pygame.event.pump() # Keep the window responsive while we load
+    win.fill((255, 204, 229))
+    font = assets.font("arial", 50)
+    text = font.render("Loading...", True, (255, 255, 255))
+    win.blit(text, (WIDTH // 2 - text.get_width() // 2, HEIGHT // 2 - 100))
+    pygame.draw.rect(win, (255, 255, 255), (WIDTH // 2 - 200, HEIGHT // 2, 400, 30), 2)
+    pygame.draw.rect(win, (200, 100, 150), (WIDTH // 2 - 196, HEIGHT // 2 + 4, int(392 * progress), 22))
+    pygame.display.update()
+
+
+# Decodes every image and sound on a thread pool while this thread shows a
+# progress bar. Only the steps that need the display (converting surfaces and
+# slicing the sprite sheets) run here. Everything ends up in the asset cache
+def preload_assets(win, workers=None):
+    jobs = asset_manifest()
+    steps = len(jobs) + len(SHEETS)
+    done = 0
+    draw_loading_screen(win, 0)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {pool.submit(decode_asset, kind, path): (kind, path) for kind, path in jobs}
+        pending = set(futures)
+        while pending:
+            finished, pending = wait(pending, timeout=1 / 30, return_when=FIRST_COMPLETED)
+            for future in finished:
+                kind, path = futures[future]
+                value = future.result()
+                if kind == "image":
+                    assets.put(("image", path, True), value.convert_alpha())
+                elif kind == "sprite":
+                    assets.put(("image", path, False), value)
+                else:
+                    assets.put((kind, path), value)
+                done += 1
+            draw_loading_screen(win, done / steps)
+
+    for sheet in SHEETS:
+        assets.sheets(*sheet)
+        done += 1
+        draw_loading_screen(win, done / steps)
+
+
+# Class attribute holding a sprite table that is only loaded the first time
+# it's read (not when the class is defined), then replaces itself with it
+class LazySprites:
+    def __init__(self, dir1, dir2, width, height, direction=False):
+        self.args = (dir1, dir2, width, height, direction)
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, owner):
+        sprites = assets.sheets(*self.args)
+        setattr(owner, self.name, sprites)
+        return sprites
 
 
 # The main Player class containing movement, physics, and animation logic
 class Player(pygame.sprite.Sprite):
     COLOR = (255, 0, 0)
     GRAVITY = 1
-    # Load the sprites for the player specifically
-    SPRITES = load_sprite_sheets("MainCharacters", "Man", 32, 32, True)
+    # Load the sprites for the player specifically (on first use)
+    SPRITES = LazySprites("MainCharacters", "Man", 32, 32, True)
     ANIMATION_DELAY = 3
 
     def __init__(self, x, y, width, height):
@@ -91,6 +545,10 @@ class Player(pygame.sprite.Sprite):
         self.hit = False
         self.hit_count = 0
         self.lives = 5 # Player health
+        self.previous = self.rect.topleft # Where the last logic step started, for drawing in between
+        # Something to draw before the first update (the screen can be drawn
+        # before the first logic step when rendering faster than FPS)
+        self.sprite = self.SPRITES["idle_" + self.direction][0].image
  
     # Handles jumping physics
     def jump(self):
@@ -113,7 +571,7 @@ class Player(pygame.sprite.Sprite):
             # Bounce player back slightly on hit
             self.y_vel = -5 
             # Play damage sound if it exists
-            if (self, "damage_sound"):
+            if hasattr(self, "damage_sound"):
                 self.damage_sound.play()
 
     # Helpers to set velocity and direction
@@ -132,8 +590,9 @@ class Player(pygame.sprite.Sprite):
     # The main update loop for the player (called every frame)
     def loop(self, fps):
         # Apply gravity (increases falling speed over time)
+        # (the actual moving happens in move_and_slide, against the level)
+        self.previous = self.rect.topleft
         self.y_vel += min(1, (self.fall_count / fps) * self.GRAVITY)
-        self.move(self.x_vel, self.y_vel)
 
         # Handle invulnerability frames after getting hit
         if self.hit:
@@ -177,156 +636,346 @@ class Player(pygame.sprite.Sprite):
         # Calculate which frame to show for animation
         sprite_index = (self.animation_count //
                         self.ANIMATION_DELAY) % len(sprites)
-        self.sprite = sprites[sprite_index]
+        self.frame = sprites[sprite_index]
+        self.sprite = self.frame.image
+        self.mask = self.frame.mask
         self.animation_count += 1
         self.update()
 
-    # Updates the rectangle and collision mask
+    # Updates the rectangle to match the current frame (mask comes with the frame)
     def update(self):
-        self.rect = self.sprite.get_rect(topleft=(self.rect.x, self.rect.y))
-        self.mask = pygame.mask.from_surface(self.sprite)
-
-    def draw(self, win, offset_x):
-        win.blit(self.sprite, (self.rect.x - offset_x, self.rect.y))
-
-# Simple class for the bullets the enemies shoot
-class Projectile(pygame.sprite.Sprite):
-    def __init__(self, x, y, direction):
-        super().__init__()
-        self.rect = pygame.Rect(x, y, 10, 10) # 10x10 pixel dot
-        self.direction = direction
-        self.vel = 7 * direction # Speed of shot
-        self.color = (0, 0, 0) # Black dot
-
-    def loop(self):
-        self.rect.x += self.vel
+        self.rect = self.frame.rect.move(self.rect.x, self.rect.y)
+
+    # alpha is how far between the last logic step and this one to draw it
+    def draw(self, win, offset_x, alpha=1.0):
+        x, y = self.rect.topleft
+        if alpha < 1:
+            x, y = lerp(self.previous[0], x, alpha), lerp(self.previous[1], y, alpha)
+        return win.blit(self.sprite, ((x - offset_x) // PIXEL, y // PIXEL))
+
+# All the bullets the enemies shoot, stored as NumPy arrays (one array per
+# field instead of one object per bullet). Moving them, checking them against
+# the player and removing old ones is done for every bullet at once
+class ProjectilePool:
+    SIZE = 10 # 10x10 pixel dot
+    SPEED = 7 # Speed of shot
+    COLOR = (0, 0, 0) # Black dot
+
+    def __init__(self, capacity=64):
+        self.x = np.zeros(capacity, dtype=np.int32)
+        self.y = np.zeros(capacity, dtype=np.int32)
+        self.vel = np.zeros(capacity, dtype=np.int32)
+        self.alive = np.zeros(capacity, dtype=bool)
+        # Live bullets are kept packed at the front of the arrays
+        self.count = 0
 
-    def draw(self, win, offset_x):
-        pygame.draw.circle(win, self.color, (self.rect.x - offset_x + 5, self.rect.y + 5), 5)
+    def __len__(self):
+        return self.count
 
+    def clear(self):
+        self.alive[:self.count] = False
+        self.count = 0
 
-# Enemy class with simple AI (patrol and shoot)
-class Enemy(pygame.sprite.Sprite):
-    SPRITES = load_sprite_sheets("MainCharacters", "bad_guy", 32, 32, True)
-    GRAVITY = 1
+    def spawn(self, x, y, direction):
+        if self.count == len(self.x):
+            self.grow()
+        i = self.count
+        self.x[i] = x
+        self.y[i] = y
+        self.vel[i] = self.SPEED * direction
+        self.alive[i] = True
+        self.count += 1
+
+    # Adds a batch of bullets at once (e.g. every enemy that fired this frame)
+    def spawn_many(self, xs, ys, directions):
+        k = len(xs)
+        while self.count + k > len(self.x):
+            self.grow()
+        i = self.count
+        self.x[i:i + k] = xs
+        self.y[i:i + k] = ys
+        self.vel[i:i + k] = self.SPEED * np.asarray(directions, dtype=np.int32)
+        self.alive[i:i + k] = True
+        self.count += k
+
+    # Doubles the capacity when the pool is full
+    def grow(self):
+        capacity = len(self.x) * 2
+        for name in ("x", "y", "vel", "alive"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    # Moves every bullet, then removes the ones that hit the player or went
+    # more than 1000px away from them. Returns how many hit the player
+    def update(self, player_rect):
+        n = self.count
+        if n == 0:
+            return 0
+        x, y = self.x[:n], self.y[:n]
+        x += self.vel[:n]
+
+        hit = ((x < player_rect.right) & (x + self.SIZE > player_rect.left) &
+               (y < player_rect.bottom) & (y + self.SIZE > player_rect.top))
+        far = (x > player_rect.x + 1000) | (x < player_rect.x - 1000)
+        self.alive[:n] &= ~(hit | far)
+        self.compact()
+        return int(np.count_nonzero(hit))
+
+    # Packs the live bullets back to the front of the arrays
+    def compact(self):
+        n = self.count
+        keep = self.alive[:n]
+        live = int(np.count_nonzero(keep))
+        if live == n:
+            return
+        for name in ("x", "y", "vel"):
+            arr = getattr(self, name)
+            arr[:live] = arr[:n][keep]
+        self.alive[:live] = True
+        self.alive[live:n] = False
+        self.count = live
+
+    # Draws the bullets inside the camera view, returns the rects drawn
+    # Bullets fly in straight lines, so drawing them between logic steps is
+    # just stepping back along their velocity
+    def draw(self, win, offset_x, alpha=1.0):
+        n = self.count
+        x, y = self.x[:n], self.y[:n]
+        if alpha < 1:
+            x = np.rint(x - self.vel[:n] * (1 - alpha)).astype(np.int32)
+        visible = np.flatnonzero((x + self.SIZE > offset_x) & (x < offset_x + WIDTH))
+        radius = self.SIZE // 2 // PIXEL
+        return [pygame.draw.circle(win, self.COLOR, ((int(x[i]) - offset_x) // PIXEL + radius,
+                                                     int(y[i]) // PIXEL + radius), radius)
+                for i in visible]
+
+
+# All the enemies in the level (simple AI: patrol and shoot), stored as NumPy
+# arrays instead of one object each. Patrols, cooldowns, hit timers and
+# animation frames are advanced for every enemy at once, and only enemies
+# whose rect overlaps the player get the pixel-perfect mask check
+class EnemyManager:
+    SPRITES = LazySprites("MainCharacters", "bad_guy", 32, 32, True)
     ANIMATION_DELAY = 4
+    SPEED = 2
+    LIVES = 3
+    SHOOT_COOLDOWN = 120 # Shoot every 2 seconds (60fps * 2)
+    HIT_FLASH = 20
+
+    FIELDS = {
+        "x": np.int32, "y": np.int32, "width": np.int32, "height": np.int32,
+        "start_x": np.int32, "patrol_distance": np.int32,
+        "direction": np.int8, # 1 = right, -1 = left
+        "x_vel": np.int32, "lives": np.int32, "shoot_cooldown": np.int32,
+        "hit": bool, "hit_timer": np.int32,
+        "animation_count": np.int32, "frame_index": np.int32,
+        "previous_x": np.int32, # x before the last update, for drawing in between
+    }
+
+    def __init__(self, capacity=16):
+        for name, dtype in self.FIELDS.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        self.count = 0
 
-    def __init__(self, x, y, width, height, patrol_distance):
-        super().__init__()
-        self.rect = pygame.Rect(x, y, width, height)
-        self.start_x = x
-        self.patrol_distance = patrol_distance
-        self.direction = "right"
-        self.x_vel = 2
-        self.y_vel = 0
-        self.animation_count = 0
-        self.mask = None
-        self.lives = 3 
-        self.shoot_cooldown = 0
-        self.hit = False
-        self.hit_timer = 0
-        
+        # We only have "run", so we use run for everything
         # Default sprite just in case assets are missing
-        self.sprite = self.SPRITES.get("run_right", [pygame.Surface((width, height))])[0]
-
-    # AI Logic: Walk back and forth within patrol distance
-    def move(self):
-        if self.direction == "right":
-            self.x_vel = 2
-            if self.rect.x > self.start_x + self.patrol_distance:
-                self.direction = "left"
-        else:
-            self.x_vel = -2
-            if self.rect.x < self.start_x:
-                self.direction = "right"
-        
-        self.rect.x += self.x_vel
+        fallback = list(self.SPRITES.values())[0] if self.SPRITES else [make_frame(pygame.Surface((50, 50)))]
+        self.frames = {1: self.SPRITES.get("run_right", fallback),
+                       -1: self.SPRITES.get("run_left", fallback)}
+        self.frame_width, self.frame_height = self.frames[1][0].rect.size
 
-    def loop(self, fps):
-        self.move()
-        self.update_sprite()
-        
-        # Decrease cooldown timer for shooting
-        if self.shoot_cooldown > 0:
-            self.shoot_cooldown -= 1
-        
-        # Flash animation if hit
-        if self.hit:
-            self.hit_timer += 1
-            if self.hit_timer > 20:
-                self.hit = False
-                self.hit_timer = 0
-
-    # Handles shooting logic with a cooldown
-    def shoot(self):
-        # Shoot every 2 seconds (60fps * 2)
-        if self.shoot_cooldown == 0:
-            self.shoot_cooldown = 120 
-            direction = 1 if self.direction == "right" else -1
-            return Projectile(self.rect.x, self.rect.y + 20, direction)
-        return None
+    def __len__(self):
+        return self.count
 
-    def update_sprite(self):
-        # We only have "run", so we use run for everything
-        sprite_name = "run_" + self.direction
-        sprites = self.SPRITES.get(sprite_name)
-        
-        if not sprites:
-            sprites = list(self.SPRITES.values())[0]
+    def clear(self):
+        self.count = 0
 
-        sprite_index = (self.animation_count // self.ANIMATION_DELAY) % len(sprites)
-        self.sprite = sprites[sprite_index]
-        self.animation_count += 1
-        
-        self.rect = self.sprite.get_rect(topleft=(self.rect.x, self.rect.y))
-        self.mask = pygame.mask.from_surface(self.sprite)
+    def add(self, x, y, width, height, patrol_distance):
+        if self.count == len(self.x):
+            self.grow()
+        i = self.count
+        self.x[i], self.y[i] = x, y
+        self.width[i], self.height[i] = width, height
+        self.start_x[i] = self.previous_x[i] = x
+        self.patrol_distance[i] = patrol_distance
+        self.direction[i] = 1
+        self.x_vel[i] = self.SPEED
+        self.lives[i] = self.LIVES
+        self.shoot_cooldown[i] = 0
+        self.hit[i] = False
+        self.hit_timer[i] = 0
+        self.animation_count[i] = 0
+        self.frame_index[i] = 0
+        self.count += 1
+        return i
+
+    # Doubles the capacity when the arrays are full
+    def grow(self):
+        capacity = len(self.x) * 2
+        for name in self.FIELDS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def alive_count(self):
+        return int(np.count_nonzero(self.lives[:self.count] > 0))
+
+    def rect(self, i):
+        return pygame.Rect(int(self.x[i]), int(self.y[i]), int(self.width[i]), int(self.height[i]))
+
+    def frame(self, i):
+        return self.frames[int(self.direction[i])][self.frame_index[i]]
+
+    # One frame of AI for every living enemy: patrol, animate, count down the
+    # shoot cooldown and hit flash, then shoot into the projectile pool
+    def update(self, projectiles):
+        n = self.count
+        if n == 0:
+            return
+        self.previous_x[:n] = self.x[:n]
+        alive = self.lives[:n] > 0
+        x = self.x[:n]
+        direction = self.direction[:n]
+
+        # AI Logic: Walk back and forth within patrol distance
+        right = direction > 0
+        x_vel = np.where(right, self.SPEED, -self.SPEED)
+        direction[alive & right & (x > self.start_x[:n] + self.patrol_distance[:n])] = -1
+        direction[alive & ~right & (x < self.start_x[:n])] = 1
+        self.x_vel[:n] = np.where(alive, x_vel, self.x_vel[:n])
+        x += np.where(alive, x_vel, 0)
+
+        # Pick the animation frame for the (possibly new) direction
+        lengths = np.where(direction > 0, len(self.frames[1]), len(self.frames[-1]))
+        animation_count = self.animation_count[:n]
+        self.frame_index[:n] = np.where(alive, (animation_count // self.ANIMATION_DELAY) % lengths,
+                                        self.frame_index[:n])
+        animation_count += alive
+        self.width[:n][alive] = self.frame_width
+        self.height[:n][alive] = self.frame_height
 
-    def draw(self, win, offset_x):
-        if self.lives > 0:
-            win.blit(self.sprite, (self.rect.x - offset_x, self.rect.y))
+        # Decrease cooldown timer for shooting
+        cooldown = self.shoot_cooldown[:n]
+        cooldown -= alive & (cooldown > 0)
+
+        # Flash animation if hit
+        hit = self.hit[:n]
+        flashing = alive & hit
+        self.hit_timer[:n] += flashing
+        done = flashing & (self.hit_timer[:n] > self.HIT_FLASH)
+        hit[done] = False
+        self.hit_timer[:n][done] = 0
+
+        # Shoot with a cooldown
+        shooting = alive & (cooldown == 0)
+        if shooting.any():
+            cooldown[shooting] = self.SHOOT_COOLDOWN
+            projectiles.spawn_many(x[shooting], self.y[:n][shooting] + 20, direction[shooting])
+
+    # Indexes of living enemies touching the player (rect test first, then masks)
+    def colliding(self, player):
+        n = self.count
+        rect = player.rect
+        x, y = self.x[:n], self.y[:n]
+        near = np.flatnonzero((self.lives[:n] > 0) &
+                              (x < rect.right) & (x + self.width[:n] > rect.left) &
+                              (y < rect.bottom) & (y + self.height[:n] > rect.top))
+        return [i for i in near
+                if player.mask.overlap(self.frame(i).mask, (int(x[i]) - rect.x, int(y[i]) - rect.y))]
+
+    # Draws the living enemies inside the camera view, returns the rects drawn
+    def draw(self, win, offset_x, alpha=1.0):
+        n = self.count
+        x = self.x[:n]
+        if alpha < 1:
+            previous = self.previous_x[:n]
+            x = np.rint(previous + (x - previous) * alpha).astype(np.int32)
+        visible = np.flatnonzero((self.lives[:n] > 0) &
+                                 (x + self.width[:n] > offset_x) & (x < offset_x + WIDTH))
+        drawn = []
+        for i in visible:
+            sx, sy = (int(x[i]) - offset_x) // PIXEL, int(self.y[i]) // PIXEL
+            rect = win.blit(self.frame(i).image, (sx, sy))
             # Draw health bars above enemy head
-            pygame.draw.rect(win, (255, 0, 0), (self.rect.x - offset_x, self.rect.y - 10, 50, 5))
-            pygame.draw.rect(win, (0, 255, 0), (self.rect.x - offset_x, self.rect.y - 10, 50 * (self.lives/3), 5))
+            bar = pygame.draw.rect(win, (255, 0, 0), (sx, sy - 10 // PIXEL, 50 // PIXEL, 5 // PIXEL))
+            pygame.draw.rect(win, (0, 255, 0),
+                             (sx, sy - 10 // PIXEL, 50 // PIXEL * (self.lives[i] / self.LIVES), 5 // PIXEL))
+            drawn.append(rect.union(bar))
+        return drawn
 
 
 # Base class for generic objects in the world
+# Pass an image to use it instead of a new blank one
 class Object(pygame.sprite.Sprite):
-    def __init__(self, x, y, width, height, name=None):
+    static = True # Looks the same every frame (see Renderer.begin)
+
+    def __init__(self, x, y, width, height, name=None, image=None):
         super().__init__()
         self.rect = pygame.Rect(x, y, width, height)
-        self.image = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.image = image if image is not None else pygame.Surface((width, height), pygame.SRCALPHA)
         self.width = width
         self.height = height
         self.name = name
 
     def draw(self, win, offset_x):
-        win.blit(self.image, (self.rect.x - offset_x, self.rect.y))
+        return win.blit(self.image, ((self.rect.x - offset_x) // PIXEL, self.rect.y // PIXEL))
 
 
 # Class for Terrain blocks
 class Block(Object):
     def __init__(self, x, y, size):
-        super().__init__(x, y, size, size)
         block = get_block(size)
-        self.image.blit(block, (0, 0))
-        self.mask = pygame.mask.from_surface(self.image)
+        super().__init__(x, y, size, size, image=block.image)
+        self.mask = block.mask
+
+
+# All the Blocks of one level chunk painted onto one surface, so the terrain
+# is a few big blits a frame instead of one per block. Blocks are opaque, so
+# the surface is too; gaps between them (if any) are colorkeyed out. The
+# Blocks stay in the spatial grid for collisions, they just aren't drawn
+class TerrainChunk:
+    COLORKEY = (255, 0, 255)
+    static = True
+
+    def __init__(self, blocks):
+        self.rect = blocks[0].rect.unionall([block.rect for block in blocks[1:]])
+        self.name = "terrain"
+        self.image = pygame.Surface((self.rect.width // PIXEL, self.rect.height // PIXEL)).convert()
+        self.image.fill(self.COLORKEY)
+        self.image.blits([(block.image, ((block.rect.x - self.rect.x) // PIXEL, (block.rect.y - self.rect.y) // PIXEL))
+                          for block in blocks], doreturn=False)
+        gaps = pygame.mask.from_threshold(self.image, self.COLORKEY, (1, 1, 1, 255))
+        if gaps.count():
+            self.image.set_colorkey(self.COLORKEY, pygame.RLEACCEL)
+
+    def draw(self, win, offset_x):
+        return win.blit(self.image, ((self.rect.x - offset_x) // PIXEL, self.rect.y // PIXEL))
 
 
 # Class for Fire Traps (includes animation)
 class Fire(Object):
     ANIMATION_DELAY = 3
+    static = False
 
     def __init__(self, x, y, width, height):
-        super().__init__(x, y, width, height, "fire")
-        self.fire = load_sprite_sheets("Traps", "Fire", width, height)
-        self.image = self.fire["off"][0]
-        self.mask = pygame.mask.from_surface(self.image)
+        self.fire = assets.sheets("Traps", "Fire", width, height)
+        super().__init__(x, y, width, height, "fire", self.fire["off"][0].image)
+        self.mask = self.fire["off"][0].mask
         self.animation_count = 0
         self.animation_name = "off"
 
     def on(self):
         self.animation_name = "on"
 
+    # Sets the animation to where it would be if this fire had been looping
+    # since frame 0 (used when the fire is built partway through the game)
+    def sync(self, frame):
+        period = self.ANIMATION_DELAY * (len(self.fire[self.animation_name]) + 1)
+        self.animation_count = frame % period
+
     def off(self):
         self.animation_name = "off"
 
@@ -334,11 +983,12 @@ class Fire(Object):
         sprites = self.fire[self.animation_name]
         sprite_index = (self.animation_count //
                         self.ANIMATION_DELAY) % len(sprites)
-        self.image = sprites[sprite_index]
+        frame = sprites[sprite_index]
+        self.image = frame.image
+        self.mask = frame.mask
         self.animation_count += 1
 
-        self.rect = self.image.get_rect(topleft=(self.rect.x, self.rect.y))
-        self.mask = pygame.mask.from_surface(self.image)
+        self.rect = frame.rect.move(self.rect.x, self.rect.y)
 
         if self.animation_count // self.ANIMATION_DELAY > len(sprites):
             self.animation_count = 0
@@ -346,21 +996,20 @@ class Fire(Object):
 # Class for the winning objective (Treasure)
 class Treasure(Object):
     def __init__(self, x, y, size):
-        super().__init__(x, y, size, size, "treasure")
-        path = join("assets", "trophy.png")
-        if os.path.exists(path):
-            img = pygame.image.load(path).convert_alpha()
-            # Scale image to fit the block size
-            self.image.blit(pygame.transform.scale(img, (size, size)), (0, 0))
-        else:
-            # Fallback: Gold square if no image found
-            self.image.fill((255, 215, 0)) 
-        self.mask = pygame.mask.from_surface(self.image)
+        trophy = get_trophy(size)
+        super().__init__(x, y, size, size, "treasure", trophy.image)
+        self.mask = trophy.mask
+
+
+# The whole pixel a fraction t of the way from a to b. Used to draw things in
+# between two logic steps
+def lerp(a, b, t):
+    return round(a + (b - a) * t)
 
 
 # Creates a tiled background so the image doesn't look stretched
 def get_background(name):
-    image = pygame.image.load(join("assets", "Background", name))
+    image = assets.sprite(join("assets", "Background", name))
     _, _, width, height = image.get_rect()
     tiles = []
 
@@ -385,59 +1034,355 @@ def draw(window, background, bg_image, player, objects, offset_x):
     pygame.display.update()
 
 
-# Checks for collisions above or below the player (floor/ceiling)
-def handle_vertical_collision(player, objects, dy):
-    collided_objects = []
-    for obj in objects:
-        if pygame.sprite.collide_mask(player, obj):
-            if dy > 0:
-                # Landed on top of object
-                player.rect.bottom = obj.rect.top
-                player.landed()
-            elif dy < 0:
-                # Hit head on bottom of object
-                player.rect.top = obj.rect.bottom
-                player.hit_head()
+# Uniform grid over the world objects so collision checks only look at the
+# cells around the player instead of walking every block in the level
+class SpatialGrid:
+    def __init__(self, cell_size, objects=()):
+        self.cell_size = cell_size
+        self.cells = {}
+        # obj -> (order number, cells it sits in). Queries come back sorted by
+        # the order number, which is the insertion order unless add() is given one
+        self.entries = {}
+        self.count = 0
+        for obj in objects:
+            self.add(obj)
+
+    # Area an object can collide with. Masks can be bigger than the rect
+    # (Fire starts with a small rect but a full size frame), so use both
+    def bounds(self, obj):
+        rect = obj.rect
+        mask = getattr(obj, "mask", None)
+        if mask is not None:
+            rect = rect.union(pygame.Rect(rect.topleft, mask.get_size()))
+        return rect
+
+    def cells_for(self, rect):
+        size = self.cell_size
+        return [(cx, cy)
+                for cx in range(rect.left // size, (rect.right - 1) // size + 1)
+                for cy in range(rect.top // size, (rect.bottom - 1) // size + 1)]
+
+    def add(self, obj, order=None):
+        if obj in self.entries:
+            self.remove(obj)
+        cells = self.cells_for(self.bounds(obj))
+        for cell in cells:
+            self.cells.setdefault(cell, []).append(obj)
+        self.entries[obj] = (self.count if order is None else order, cells)
+        self.count += 1
+
+    def remove(self, obj):
+        _, cells = self.entries.pop(obj)
+        for cell in cells:
+            bucket = self.cells[cell]
+            bucket.remove(obj)
+            if not bucket:
+                del self.cells[cell]
+
+    # Returns every object whose cells overlap the rect, in insertion order
+    def query(self, rect):
+        found = set()
+        for cell in self.cells_for(rect):
+            bucket = self.cells.get(cell)
+            if bucket:
+                found.update(bucket)
+        return sorted(found, key=lambda obj: self.entries[obj][0])
+
+    def __iter__(self):
+        return iter(list(self.entries))
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# Keeps world objects sorted by their left edge so the draw pass can pull out
+# only the ones inside the camera viewport with two binary searches
+class ViewIndex:
+    def __init__(self, objects=()):
+        self.lefts = []
+        self.items = []
+        self.order = {} # obj -> order number (insertion order by default), so draw order stays the same
+        self.count = 0
+        self.max_width = 0 # widest object, how far left of the view we must look
+        for obj in objects:
+            self.add(obj)
+
+    def add(self, obj, order=None):
+        left = obj.rect.left
+        i = bisect_right(self.lefts, left)
+        self.lefts.insert(i, left)
+        self.items.insert(i, obj)
+        self.order[obj] = self.count if order is None else order
+        self.count += 1
+        self.max_width = max(self.max_width, obj.rect.width, obj.image.get_width())
+
+    def remove(self, obj):
+        i = bisect_left(self.lefts, obj.rect.left)
+        while self.items[i] is not obj:
+            i += 1
+        del self.lefts[i]
+        del self.items[i]
+        del self.order[obj]
+
+    # Objects that overlap the x range [left, right), in the order they were added
+    def visible(self, left, right):
+        start = bisect_right(self.lefts, left - self.max_width)
+        end = bisect_left(self.lefts, right)
+        found = [obj for obj in self.items[start:end]
+                 if obj.rect.left + max(obj.rect.width, obj.image.get_width()) > left]
+        found.sort(key=self.order.__getitem__)
+        return found
+
+
+# Default renderer: redraws the whole background and flips the whole window
+class Renderer:
+    def __init__(self, background, bg_image):
+        self.background = background
+        self.bg_image = bg_image
+
+    # Starts a frame: draws the background and the scenery (the visible
+    # objects that never change, like terrain) under everything else.
+    # Returns the surface to draw the rest of the world on
+    def begin(self, win, offset_x, scenery):
+        for tile in self.background:
+            win.blit(self.bg_image, tile)
+        for obj in scenery:
+            obj.draw(win, offset_x)
+        return win
+
+    # Puts the world drawn on begin()'s surface into the window, before the
+    # HUD goes on top. Nothing to do when the world was drawn on the window
+    def compose(self, win):
+        pass
+
+    # Records a screen rect that was drawn to this frame (unused when we flip everything)
+    def mark(self, rect):
+        pass
+
+    # Marks the whole window as changed (something covered it, like the end
+    # screen): push all of it now and repaint everything next frame
+    def invalidate(self):
+        pass
+
+    def present(self):
+        pygame.display.update()
 
-            collided_objects.append(obj)
 
-    return collided_objects
+# Renderer for native resolution mode: the world is drawn at 1x onto a canvas
+# PIXEL times smaller than the window, which is scaled up into the window in
+# one go. The whole window changes every frame, so it's always a full flip
+class NativeRenderer(Renderer):
+    def __init__(self, background, bg_image):
+        super().__init__(background, bg_image)
+        backdrop = pygame.Surface((WIDTH, HEIGHT)).convert()
+        for tile in background:
+            backdrop.blit(bg_image, tile)
+        self.backdrop = pygame.transform.smoothscale(backdrop, (WIDTH // PIXEL, HEIGHT // PIXEL))
+        self.canvas = pygame.Surface(self.backdrop.get_size()).convert()
+
+    def begin(self, win, offset_x, scenery):
+        self.canvas.blit(self.backdrop, (0, 0))
+        for obj in scenery:
+            obj.draw(self.canvas, offset_x)
+        return self.canvas
+
+    def compose(self, win):
+        pygame.transform.scale(self.canvas, win.get_size(), win)
+
+
+# Optional renderer for slow software displays. It keeps the tiled background
+# composited on one surface and the scenery drawn over it on a second one
+# (only repainted when the camera moves), erases last frame's sprites by
+# copying that back over them and only pushes the touched rects to the
+# display. With a still camera that is just the moving sprites and the HUD.
+# If the camera jumps further than scroll_threshold it does a full redraw
+class DirtyRenderer(Renderer):
+    def __init__(self, background, bg_image, scroll_threshold=WIDTH // 4):
+        super().__init__(background, bg_image)
+        self.composite = pygame.Surface((WIDTH, HEIGHT)).convert()
+        for tile in background:
+            self.composite.blit(bg_image, tile)
+        self.layer = self.composite.copy() # background plus scenery
+        self.scroll_threshold = scroll_threshold
+        self.last_offset = None
+        self.scenery = [] # rects of the scenery on the layer
+        self.moved = [] # where the scenery was and is, when the camera moved
+        self.previous = [] # rects drawn last frame, to be erased
+        self.dirty = [] # rects drawn this frame
+        self.full_redraw = True
+
+    def begin(self, win, offset_x, scenery):
+        if self.last_offset is None or abs(offset_x - self.last_offset) > self.scroll_threshold:
+            self.full_redraw = True
+        if self.full_redraw or offset_x != self.last_offset:
+            self.layer.blit(self.composite, (0, 0))
+            old = self.scenery
+            self.scenery = [rect for rect in (obj.draw(self.layer, offset_x) for obj in scenery) if rect]
+            self.moved = old + self.scenery
+        if self.full_redraw:
+            win.blit(self.layer, (0, 0))
+        else:
+            for rect in self.previous + self.moved:
+                win.blit(self.layer, rect, rect)
+        self.last_offset = offset_x
+        return win
+
+    def mark(self, rect):
+        # Off-screen blits come back as zero sized rects, nothing to push
+        if rect:
+            self.dirty.append(rect)
+
+    def invalidate(self):
+        self.full_redraw = True
+        self.last_offset = None
+
+    def present(self):
+        if self.full_redraw:
+            pygame.display.update()
+        else:
+            pygame.display.update(self.previous + self.moved + self.dirty)
+        self.previous = self.dirty
+        self.dirty = []
+        self.moved = []
+        self.full_redraw = False
+
+
+# What the player ran into during one move_and_slide: the objects that
+# stopped it on the way down, up and sideways (or None), and every fire it
+# touched
+Contacts = namedtuple("Contacts", ["ground", "ceiling", "wall", "fire"])
+
+# How far the player moves before checking for collisions again. Smaller
+# than anything solid in the level, so a fast fall can't skip a platform
+SWEEP_STEP = 16
+
+
+# First of `candidates` the player's mask overlaps with its top left at (x, y)
+def overlapping(player, candidates, x, y):
+    rect = player.rect.move(x - player.rect.x, y - player.rect.y)
+    for obj in candidates:
+        if rect.colliderect(obj.rect) and player.mask.overlap(obj.mask, (obj.rect.x - x, obj.rect.y - y)):
+            return obj
+    return None
+
+
+# Moves the player up to `distance` pixels along one axis (0 = x, 1 = y),
+# stopping right before the first thing in the way. Steps SWEEP_STEP at a
+# time, then bisects the last step to find where the contact is.
+# Returns what it ran into, or None
+def sweep(player, candidates, axis, distance):
+    x, y = player.rect.topleft
+
+    def blocked(d):
+        return overlapping(player, candidates, x + d, y) if axis == 0 else overlapping(player, candidates, x, y + d)
+
+    sign = 1 if distance > 0 else -1
+    free = 0
+    hit = None
+    while free != distance:
+        step = free + sign * min(SWEEP_STEP, abs(distance - free))
+        hit = blocked(step)
+        if hit is not None:
+            break
+        free = step
+
+    if hit is not None:
+        lo, hi = free, step
+        while abs(hi - lo) > 1:
+            mid = (lo + hi) // 2
+            obj = blocked(mid)
+            if obj is not None:
+                hi, hit = mid, obj
+            else:
+                lo = mid
+        free = lo
 
+    player.move(free, 0) if axis == 0 else player.move(0, free)
+    return hit
 
-# Checks for horizontal collisions so we don't walk through walls
-def collide(player, objects, dx):
-    player.move(dx, 0)
-    player.update()
-    collided_object = None
-    for obj in objects:
-        if pygame.sprite.collide_mask(player, obj):
-            collided_object = obj
+
+# Pushes the player out of `obj` a pixel at a time along whichever axis they
+# overlap least on. This happens when the new animation frame is a bit wider
+# or taller than the last one. Returns the axis and direction it pushed
+def push_out(player, obj):
+    clip = player.rect.clip(obj.rect)
+    if clip.width < clip.height:
+        axis, sign, limit = 0, (-1 if player.rect.centerx < obj.rect.centerx else 1), clip.width
+    else:
+        axis, sign, limit = 1, (-1 if player.rect.centery < obj.rect.centery else 1), clip.height
+    for _ in range(max(limit, 1)):
+        player.move(sign, 0) if axis == 0 else player.move(0, sign)
+        if not pygame.sprite.collide_mask(player, obj):
             break
+    return axis, sign
 
-    player.move(-dx, 0)
-    player.update()
-    return collided_object
 
+# Moves the player by (dx, dy) against the level: first out of anything it's
+# already inside, then along x, then along y, each stopping at the first
+# contact. One broadphase query covers the whole move
+def move_and_slide(player, objects, dx, dy):
+    dx, dy = round(dx), round(dy)
+    candidates = objects.query(player.rect.union(player.rect.move(dx, dy)))
+    ground = ceiling = wall = None
+    touched = []
 
-# Processes keyboard input for movement
-def handle_move(player, objects):
-    keys = pygame.key.get_pressed()
+    for _ in range(len(candidates)):
+        obj = overlapping(player, candidates, player.rect.x, player.rect.y)
+        if obj is None:
+            break
+        touched.append(obj)
+        # Only stop the player if they were moving into it; a jump that starts
+        # with the feet a pixel in the ground shouldn't be cancelled
+        axis, sign = push_out(player, obj)
+        if axis == 0:
+            wall = obj
+        elif sign < 0:
+            ground = obj
+            if player.y_vel >= 0:
+                player.landed()
+        else:
+            ceiling = obj
+            if player.y_vel < 0:
+                player.hit_head()
 
-    player.x_vel = 0
-    collide_left = collide(player, objects, -PLAYER_VEL * 2)
-    collide_right = collide(player, objects, PLAYER_VEL * 2)
+    if dx:
+        obj = sweep(player, candidates, 0, dx)
+        if obj is not None:
+            wall = obj
+            touched.append(obj)
+
+    if dy:
+        obj = sweep(player, candidates, 1, dy)
+        if obj is not None:
+            touched.append(obj)
+            if dy > 0:
+                # Landed on top of object
+                ground = obj
+                player.landed()
+            else:
+                # Hit head on bottom of object
+                ceiling = obj
+                player.hit_head()
+
+    return Contacts(ground, ceiling, wall, [obj for obj in touched if obj.name == "fire"])
+
+
+# Processes keyboard input for movement, then moves the player
+# keys can be passed in (scripted input), otherwise the keyboard is read
+def handle_move(player, objects, keys=None):
+    if keys is None:
+        keys = pygame.key.get_pressed()
 
-    if keys[pygame.K_LEFT] and not collide_left:
+    player.x_vel = 0
+    if keys[pygame.K_LEFT]:
         player.move_left(PLAYER_VEL)
-    if keys[pygame.K_RIGHT] and not collide_right:
+    if keys[pygame.K_RIGHT]:
         player.move_right(PLAYER_VEL)
 
-    vertical_collide = handle_vertical_collision(player, objects, player.y_vel)
-    to_check = [collide_left, collide_right, *vertical_collide]
-
-    for obj in to_check:
-        if obj and obj.name == "fire":
-            player.make_hit()
+    contacts = move_and_slide(player, objects, player.x_vel, player.y_vel)
+    if contacts.fire:
+        player.make_hit()
+    return contacts
 
 # UI helper to draw interactive buttons
 def button(win, text, x, y ,w ,h):
@@ -446,8 +1391,8 @@ def button(win, text, x, y ,w ,h):
 
     pygame.draw.rect(win,(200,100,150), (x, y ,w ,h))
 
-    font = pygame.font.SysFont("arial", 35)
-    text_surf = font.render(text,True, (255,255,255))
+    font = assets.font("arial", 35)
+    text_surf = texts.text(font, text, (255,255,255))
     win.blit(
         text_surf,
         (x + (w - text_surf.get_width()) // 2,
@@ -459,110 +1404,689 @@ def button(win, text, x, y ,w ,h):
             return True
     return False
 
-# Draws the Heads-Up Display (Lives, Score, Time)
-def draw_hud(win, player, score, start_ticks):
-    font = pygame.font.SysFont("arial", 30)
-    
-    # Check if heart image exists, otherwise draw text
-    if isfile("assets/heart.png"):
-        heart_img = pygame.image.load("assets/heart.png").convert_alpha()
-        for i in range(player.lives):
-            win.blit(heart_img,(20 +i * 40, 20))
-    else:
-        text_lives = font.render(f"Lives: {player.lives}", True, (255,0,0))
-        win.blit(text_lives, (20, 20))
+# The Heads-Up Display (Lives, Score, Time). Everything is composited onto one
+# surface that is only redrawn when one of the three numbers changes, so most
+# frames it's a single blit
+class Hud:
+    def __init__(self):
+        self.state = None
+        self.surface = None
+        self.position = (0, 0)
+
+    # Returns the screen area it drew over
+    def draw(self, win, player, score, seconds):
+        state = (player.lives, score, seconds)
+        if state != self.state:
+            self.compose(*state)
+            self.state = state
+        return win.blit(self.surface, self.position)
+
+    def compose(self, lives, score, seconds):
+        font = assets.font("arial", 30)
+
+        # Check if heart image exists, otherwise draw text
+        heart_img = assets.sprite("assets/heart.png", optional=True)
+        if heart_img is not None:
+            parts = [(heart_img, (20 + i * 40, 20)) for i in range(lives)]
+        else:
+            parts = [(texts.text(font, f"Lives: {lives}", (255,0,0)), (20, 20))]
+        parts.append((texts.text(font, f"Score: {score}", (102,0,51)), (20, 60)))
+        parts.append((texts.text(font, f"Time: {seconds}", (0,0,0)), (20, 100)))
+
+        rects = [image.get_rect(topleft=pos) for image, pos in parts]
+        bounds = rects[0].unionall(rects[1:])
+        self.surface = pygame.Surface(bounds.size, pygame.SRCALPHA)
+        for image, (x, y) in parts:
+            self.surface.blit(image, (x - bounds.x, y - bounds.y))
+        self.position = bounds.topleft
+
+# Times each phase of a frame (events, physics, enemies, drawing, ...).
+# lap(name) closes the phase that started at the previous lap. It keeps a
+# rolling window for the on-screen overlay and the last `history` frames of
+# events for exporting as a Chrome trace (open in chrome://tracing or Perfetto)
+class FrameProfiler:
+    def __init__(self, history=FPS * 10, window=FPS):
+        self.history = history
+        self.window = window
+        self.frames = deque(maxlen=history) # each frame: list of (name, start, duration)
+        self.recent = {} # name -> last `window` durations
+        self.overlay = False
+        self.current = None
+        self.frame_start = self.last = 0.0
+
+    def begin_frame(self):
+        self.frame_start = self.last = time.perf_counter()
+        self.current = []
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.record(name, self.last, now - self.last)
+        self.last = now
+
+    def end_frame(self):
+        now = time.perf_counter()
+        self.record("frame", self.frame_start, now - self.frame_start)
+        self.frames.append(self.current)
+
+    def record(self, name, start, duration):
+        self.current.append((name, start, duration))
+        samples = self.recent.get(name)
+        if samples is None:
+            samples = self.recent[name] = deque(maxlen=self.window)
+        samples.append(duration)
+
+    # Rolling average of every phase, in milliseconds
+    def averages(self):
+        return {name: sum(samples) / len(samples) * 1000 for name, samples in self.recent.items()}
+
+    # Draws the rolling timings in the top right corner, returns the rect drawn
+    def draw_overlay(self, win):
+        font = assets.font("consolas", 16)
+        lines = [f"{name:<12}{ms:6.2f} ms" for name, ms in self.averages().items()]
+        surfaces = [font.render(line, True, (255, 255, 255)) for line in lines]
+        width = max((surf.get_width() for surf in surfaces), default=0) + 10
+        height = sum(surf.get_height() for surf in surfaces) + 10
+        box = pygame.Rect(WIDTH - width - 10, 10, width, height)
+        pygame.draw.rect(win, (0, 0, 0), box)
+        y = box.y + 5
+        for surf in surfaces:
+            win.blit(surf, (box.x + 5, y))
+            y += surf.get_height()
+        return box
+
+    # Writes the recorded frames as Chrome trace-event JSON
+    def export_chrome_trace(self, path):
+        if not self.frames:
+            return
+        origin = self.frames[0][0][1]
+        events = []
+        for frame in self.frames:
+            for name, start, duration in frame:
+                events.append({
+                    "name": name, "cat": "frame" if name == "frame" else "phase", "ph": "X",
+                    "ts": (start - origin) * 1e6, "dur": duration * 1e6, "pid": 1, "tid": 1,
+                })
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+# Profiler used when profiling is off. Every call does nothing
+class NullProfiler:
+    overlay = False
+
+    def begin_frame(self):
+        pass
+
+    def lap(self, name):
+        pass
+
+    def end_frame(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+# Every live Surface and Mask (with how many bytes their pixels take) and a
+# count of the instances of each class from this file, found by walking
+# everything the garbage collector knows about. Surfaces only C code holds on
+# to (like the display surface) aren't seen. Takes tens of milliseconds.
+# What the asset caches hold is left out (they are capped, and the text cache
+# gets a new "Time: N" every second); only their totals are reported
+def memory_census():
+    gc.collect()
+    seen = set() # ids of cached objects, and of untracked tuples already walked
+    pending = [value for cache in (assets, texts) for value, _ in cache.entries.values()]
+    while pending:
+        obj = pending.pop()
+        if id(obj) not in seen:
+            seen.add(id(obj))
+            if isinstance(obj, dict):
+                pending += obj.values()
+            elif isinstance(obj, (list, tuple)):
+                pending += obj
+
+    surfaces, masks, entities = {}, {}, {}
+    pending = [obj for obj in gc.get_objects() if id(obj) not in seen]
+    while pending:
+        obj = pending.pop()
+        kind = type(obj)
+        if kind.__module__ == __name__:
+            entities[kind.__name__] = entities.get(kind.__name__, 0) + 1
+        for ref in gc.get_referents(obj):
+            if id(ref) in seen:
+                continue
+            if type(ref) is pygame.Surface:
+                surfaces[id(ref)] = ref
+            elif type(ref) is pygame.mask.Mask:
+                masks[id(ref)] = ref
+            elif isinstance(ref, tuple) and not gc.is_tracked(ref):
+                # The collector stops tracking tuples that only hold untracked
+                # things, like Frames, so look inside those ourselves
+                seen.add(id(ref))
+                pending.append(ref)
+
+    # Subsurfaces share their parent's pixels, so they don't add any bytes
+    subsurfaces = sum(1 for surface in surfaces.values() if surface.get_parent() is not None)
+    return {
+        "surfaces": len(surfaces),
+        "subsurfaces": subsurfaces,
+        "surface_bytes": sum(surface.get_pitch() * surface.get_height()
+                             for surface in surfaces.values() if surface.get_parent() is None),
+        "masks": len(masks),
+        "mask_bytes": sum(asset_size(mask) for mask in masks.values()),
+        "asset_cache_bytes": assets.total_bytes,
+        "text_cache_bytes": texts.total_bytes,
+        "entities": dict(sorted(entities.items())),
+    }
+
+
+# Where the memory telemetry writes its snapshots (one JSON object per line)
+TELEMETRY_PATH = "aya-memory.jsonl"
+
+
+# Keeps an eye on memory for long running games. Every frame it notes how many
+# Python memory blocks were allocated (net) and how often the garbage
+# collector ran, and every `interval` frames it writes those numbers to the
+# log. A full memory_census() stalls the game for tens of milliseconds, so it
+# only runs on each game restart and at exit, plus every `census_interval`
+# frames if that is set (it's off by default).
+# A restart puts the game back in the same state, so from the second restart
+# on anything higher than at every restart before it gets flagged in the log
+# and printed. The first run is left out since things are still loading for
+# the first time during it, and the asset caches (capped anyway) aren't
+# checked
+class MemoryTelemetry:
+    def __init__(self, path=TELEMETRY_PATH, interval=FPS * 10, census_interval=0):
+        self.path = path
+        self.interval = interval
+        self.census_interval = census_interval
+        self.log = open(path, "w")
+        self.start = time.perf_counter()
+        self.frame = 0
+        self.restarts = -1 # The first reset is the game starting
+        self.peak = None # Highest of each census number over the restarts so far
+        self.begin_interval()
+
+    def begin_interval(self):
+        self.frames = 0
+        self.blocks = sys.getallocatedblocks()
+        self.allocated = self.max_allocated = 0
+        self.collections = gc.get_stats()[0]["collections"]
+
+    def end_frame(self):
+        blocks = sys.getallocatedblocks()
+        allocated = blocks - self.blocks
+        self.blocks = blocks
+        if allocated > 0:
+            self.allocated += allocated
+            self.max_allocated = max(self.max_allocated, allocated)
+        self.frames += 1
+        self.frame += 1
+        if self.census_interval and self.frame % self.census_interval == 0:
+            self.snapshot("census")
+        elif self.frames >= self.interval:
+            self.snapshot("periodic", census=False)
+
+    # Called at the end of Game.reset()
+    def restart(self):
+        self.restarts += 1
+        census = self.snapshot("start" if self.restarts == 0 else "restart")
+        if self.restarts == 0:
+            return
+        totals = {key: census[key] for key in ("surfaces", "surface_bytes", "masks", "mask_bytes")}
+        totals.update(census["entities"])
+        if self.peak is not None:
+            growth = {key: value - self.peak.get(key, 0) for key, value in totals.items()
+                      if value > self.peak.get(key, 0)}
+            if growth:
+                self.write({"event": "growth", "frame": self.frame, "restart": self.restarts, "growth": growth})
+                print(f"Memory grew over earlier restarts (restart {self.restarts}): {growth}", file=sys.stderr)
+            for key, value in self.peak.items():
+                totals[key] = max(totals.get(key, 0), value)
+        self.peak = totals
+
+    def snapshot(self, event, census=True):
+        census = memory_census() if census else {}
+        self.write({
+            "event": event,
+            "seconds": round(time.perf_counter() - self.start, 3),
+            "frame": self.frame,
+            "python_blocks": sys.getallocatedblocks(),
+            "per_frame": {
+                "frames": self.frames,
+                "mean_blocks": self.allocated / self.frames if self.frames else 0.0,
+                "max_blocks": self.max_allocated,
+                "gc_collections": gc.get_stats()[0]["collections"] - self.collections,
+            },
+            **census,
+        })
+        self.begin_interval()
+        return census
+
+    def write(self, entry):
+        self.log.write(json.dumps(entry) + "\n")
+        self.log.flush() # So the log is there even if the game crashes
+
+    def close(self):
+        self.snapshot("exit")
+        self.log.close()
+
+
+# Telemetry used when it's off. Every call does nothing
+class NullTelemetry:
+    def end_frame(self):
+        pass
+
+    def restart(self):
+        pass
+
+    def close(self):
+        pass
+
+
+NULL_TELEMETRY = NullTelemetry()
+
+
+# Stand-in for pygame.key.get_pressed() built from a set of held key codes,
+# used when input comes from a script instead of the keyboard
+class KeyState:
+    def __init__(self, held=()):
+        self.held = frozenset(held)
+
+    def __getitem__(self, key):
+        return key in self.held
+
+
+# Does nothing when played. Used in place of real sounds when running headless
+class SilentSound:
+    def play(self, *args):
+        pass
+
+    def set_volume(self, volume):
+        pass
+
+
+# --- GAME STATE ---
+
+# Levels live in JSON files, in blocks. Ground ranges are [start, end)
+# columns, floating blocks are [column, rows up from the bottom], fires are
+# columns, enemies are [column, patrol distance] and the treasure column is
+# where the trophy appears once every enemy is dead
+LEVEL_PATH = join("levels", "level1.json")
+
+
+def load_level(path=LEVEL_PATH):
+    with open(path) as f:
+        return parse_level(json.load(f))
+
+
+# Level data as loaded from JSON into the tuples the game uses
+def parse_level(data):
+    return {
+        "ground": [tuple(r) for r in data["ground"]],
+        "blocks": [tuple(b) for b in data["blocks"]],
+        "fires": list(data["fires"]),
+        "enemies": [tuple(e) for e in data["enemies"]],
+        "treasure": data["treasure"],
+    }
+
+
+# Builds a level's Blocks and Fires in horizontal chunks of chunk_columns
+# blocks. Only chunks near the camera exist; chunks far behind or ahead are
+# released again, so memory and start-up time stay the same however long the
+# level is. Every piece keeps its place in the full level's build order, so
+# collisions and drawing come out exactly as if everything had been built
+class LevelStreamer:
+    def __init__(self, game, level, chunk_columns=16):
+        self.game = game
+        self.chunk_columns = chunk_columns
+        self.chunk_width = chunk_columns * game.block_size
+        self.chunks = {} # chunk index -> [(order, kind, column, rows up)]
+        self.loaded = {} # chunk index -> objects built for it
+        self.terrain = {} # chunk index -> its blocks baked into a TerrainChunk
+
+        pieces = [("block", i, 1) for start, end in level["ground"] for i in range(start, end)]
+        pieces += [("block", x, height) for x, height in level["blocks"]]
+        pieces += [("fire", x, 1) for x in level["fires"]]
+        for order, (kind, column, rows) in enumerate(pieces):
+            self.chunks.setdefault(column // chunk_columns, []).append((order, kind, column, rows))
+        self.count = len(pieces) # Order number for anything added after the level (the treasure)
+
+    # Loads chunks within half a screen of the view, releases ones that are
+    # more than `keep` chunks beyond that
+    def update(self, offset_x, keep=1):
+        margin = WIDTH // 2
+        first = (offset_x - margin) // self.chunk_width
+        last = (offset_x + WIDTH + margin) // self.chunk_width
+        for index in range(first, last + 1):
+            if index in self.chunks and index not in self.loaded:
+                self.load(index)
+        for index in list(self.loaded):
+            if index < first - keep or index > last + keep:
+                self.release(index)
+
+    def load(self, index):
+        game = self.game
+        block_size = game.block_size
+        built = []
+        blocks = []
+        for order, kind, column, rows in self.chunks[index]:
+            if kind == "block":
+                obj = Block(column * block_size, HEIGHT - block_size * rows, block_size)
+                blocks.append((order, obj))
+            else:
+                obj = Fire(column * block_size, HEIGHT - block_size - 64, 16, 32)
+                obj.on()
+                obj.sync(game.frame)
+                game.fires.append(obj)
+                game.view.add(obj, order)
+            game.objects.add(obj, order)
+            built.append(obj)
+        self.loaded[index] = built
+
+        # The level lists every block before any fire, so drawing the baked
+        # terrain under the first block's order keeps the same draw order.
+        # Headless games never draw, so they don't need it
+        if blocks and not HEADLESS:
+            terrain = self.terrain[index] = TerrainChunk([obj for _, obj in blocks])
+            game.view.add(terrain, min(order for order, _ in blocks))
+
+    def release(self, index):
+        game = self.game
+        for obj in self.loaded.pop(index):
+            game.objects.remove(obj)
+            if obj.name == "fire":
+                game.view.remove(obj)
+                game.fires.remove(obj)
+        terrain = self.terrain.pop(index, None)
+        if terrain is not None:
+            game.view.remove(terrain)
+
+
+# One play-through: the level, player, enemies, score and win/lose state.
+# step() advances the game logic by one frame and draw() renders it, so the
+# same logic runs in the window (main) and without one (run_headless)
+class Game:
+    def __init__(self, sound=True, level=None, profiler=NULL_PROFILER, telemetry=NULL_TELEMETRY):
+        init()
+        self.block_size = block_size = 96
+        self.level = level = level or load_level()
+        self.profiler = profiler
+        self.telemetry = telemetry
+        self.scroll_area_width = 200
+
+        # Spatial grid for collisions and an x-sorted index so we only draw
+        # what the camera can see. The streamer fills both with the level
+        # chunks around the camera
+        self.objects = SpatialGrid(block_size)
+        self.view = ViewIndex()
+        self.fires = []
+        self.streamer = LevelStreamer(self, level)
+
+        self.enemies = EnemyManager()
+        self.projectiles = ProjectilePool()
+        self.treasure = None
+        self.hud = Hud()
+
+        if sound:
+            # Load background music
+            pygame.mixer.music.load(io.BytesIO(assets.music(MUSIC_PATH)), "mp3")
+            pygame.mixer.music.set_volume(0.3)
+
+            # Load sound effects
+            self.lose_sound = assets.sound(SOUND_PATHS["lose"])
+            self.lose_sound.set_volume(0.7)
+
+            self.jump_sound = assets.sound(SOUND_PATHS["jump"])
+            self.jump_sound.set_volume(0.6)
+
+            self.win_sound = assets.sound(SOUND_PATHS["win"])
+            self.win_sound.set_volume(0.7)
+
+            self.damage_sound = assets.sound(SOUND_PATHS["damage"])
+            self.damage_sound.set_volume(0.6)
+        else:
+            self.lose_sound = self.jump_sound = self.win_sound = self.damage_sound = SilentSound()
+        self.sound = sound
+
+        self.reset()
+
+    # Puts the game back to the start: new player, enemies, score and timer.
+    # The terrain, surfaces and sounds that are already loaded are kept, so
+    # restarting is instant and doesn't build up memory
+    def reset(self):
+        block_size = self.block_size
+        self.frame = 0
+
+        self.player = Player(100, 100, 50, 50)
+        self.player.damage_sound = self.damage_sound
+
+        # Create Enemies. They are just rows in a few arrays, so the whole
+        # level's enemies are made up front and keep patrolling off-screen
+        self.enemies.clear()
+        for x, patrol in self.level["enemies"]:
+            self.enemies.add(block_size * x, HEIGHT - block_size - 64, 50, 50, block_size * patrol)
+
+        self.projectiles.clear()
+
+        if self.treasure is not None:
+            self.objects.remove(self.treasure)
+            self.view.remove(self.treasure)
+        self.treasure = None # Will be created when enemies are dead
+
+        self.offset_x = self.previous_offset_x = 0
+        self.game_over = False
+        self.game_won = False
+        self.score = 0
+        self.lose_played = False
+        self.win_played = False
+        # Exactly the chunks a new game starts with, wherever the last run ended
+        self.streamer.update(self.offset_x, keep=0)
+        # Blocks never change, but fires restart their animation
+        for f in self.fires:
+            f.sync(self.frame)
+
+        if self.sound:
+            pygame.mixer.music.play(-1) # -1 means loop forever
+        self.telemetry.restart()
+
+    # Space bar: single or double jump
+    def jump(self):
+        if self.player.jump_count < 2:
+            self.player.jump()
+            self.jump_sound.play()
+
+    # Stops the music (if we have any) and plays the win/lose sound
+    def play_end_sound(self, end_sound):
+        if self.sound:
+            pygame.mixer.music.stop()
+        end_sound.play()
+
+    # Advances the game logic by one frame. keys works like pygame.key.get_pressed()
+    def step(self, keys=None):
+        profiler = self.profiler
+        self.previous_offset_x = self.offset_x
+        self.streamer.update(self.offset_x)
+        profiler.lap("streaming")
+        self.update_player()
+        profiler.lap("player")
+        self.update_fires()
+        profiler.lap("fires")
+        self.update_movement(keys)
+        profiler.lap("move")
+        self.update_enemies()
+        profiler.lap("enemies")
+        self.update_projectiles()
+        profiler.lap("projectiles")
+        self.check_end()
+        profiler.lap("win_lose")
+        self.frame += 1
+
+    # Gravity, movement and invulnerability timer for the player
+    def update_player(self):
+        self.player.loop(FPS)
+
+    def update_fires(self):
+        for f in self.fires:
+            f.loop()
+
+    # Keyboard movement and collisions with the level
+    def update_movement(self, keys=None):
+        handle_move(self.player, self.objects, keys)
+
+    def update_enemies(self):
+        player = self.player
+
+        # --- CHECK ENEMIES & TREASURE ---
+        # If all enemies are dead and treasure hasn't spawned yet, create it
+        if self.treasure is None and not self.enemies.alive_count():
+            # Create treasure at the end of the map
+            self.treasure = Treasure(self.block_size * self.level["treasure"], HEIGHT - self.block_size - 96, 96)
+            self.objects.add(self.treasure, self.streamer.count) # Add to objects so it gets drawn
+            self.view.add(self.treasure, self.streamer.count)
+
+        # --- ENEMY LOGIC ---
+        enemies = self.enemies
+        enemies.update(self.projectiles)
+
+        # Check collision: Player vs Enemy
+        for i in enemies.colliding(player):
+            # Goomba Stomp logic (if falling on top of enemy)
+            if player.y_vel > 0 and player.rect.bottom < enemies.rect(i).centery + 10:
+                enemies.lives[i] -= 1
+                enemies.hit[i] = True
+                player.y_vel = -8
+                player.jump_count = 1
+                self.score += 100
+            else:
+                player.make_hit()
 
-    score_text = font.render(f"Score: {score}", True, (102,0,51))
-    win.blit(score_text, (20, 60))
+    # Handle Projectiles (Bullets)
+    def update_projectiles(self):
+        # Moves them all, drops the ones that hit us or flew off screen
+        if self.projectiles.update(self.player.rect):
+            self.player.make_hit()
+
+    # --- CHECK WIN/LOSE CONDITIONS ---
+    def check_end(self):
+        player = self.player
+
+        # 1. Lose Condition: Out of lives or fell in hole
+        if (player.lives <= 0 or player.rect.top > HEIGHT) and not self.game_over:
+            self.game_over = True
+            if not self.lose_played:
+                self.play_end_sound(self.lose_sound)
+                self.lose_played = True
+
+        # 2. Win Condition (Touching Treasure)
+        if self.treasure and pygame.sprite.collide_rect(player, self.treasure):
+            self.game_won = True
+            self.game_over = True # Stop the game loop logic
+
+            if not self.win_played:
+                self.play_end_sound(self.win_sound)
+                self.win_played = True
+
+    # Renders the world and HUD for the current camera position. alpha (0 to
+    # 1) is how far the render time is between the last logic step and the
+    # next one; moving things and the camera are drawn that far along from
+    # where they were before the last step, so motion stays smooth when the
+    # render rate isn't FPS
+    def draw(self, win, renderer, alpha=1.0):
+        offset_x = self.offset_x
+        if alpha < 1:
+            offset_x = lerp(self.previous_offset_x, offset_x, alpha)
+        # Only draw what is inside the viewport. Scenery goes under the rest
+        visible = self.view.visible(offset_x, offset_x + WIDTH)
+        world = renderer.begin(win, offset_x, [obj for obj in visible if obj.static])
+        for obj in visible:
+            if not obj.static:
+                renderer.mark(obj.draw(world, offset_x))
+
+        for rect in self.enemies.draw(world, offset_x, alpha):
+            renderer.mark(rect)
+
+        for rect in self.projectiles.draw(world, offset_x, alpha):
+            renderer.mark(rect)
+
+        renderer.mark(self.player.draw(world, offset_x, alpha))
+        renderer.compose(win)
+        self.profiler.lap("draw")
+        # Time played is counted in game frames, so a replay shows the same clock
+        renderer.mark(self.hud.draw(win, self.player, self.score, self.frame // FPS))
+        self.profiler.lap("hud")
+
+    # How the run stands, for headless runs and recordings
+    def summary(self):
+        return {
+            "frames": self.frame,
+            "won": self.game_won,
+            "game_over": self.game_over,
+            "score": self.score,
+            "lives": self.player.lives,
+            "x": self.player.rect.x,
+            "y": self.player.rect.y,
+        }
+
+    # Update scroll based on player position
+    # Keeps the player somewhat centered
+    def update_camera(self):
+        player = self.player
+        if ((player.rect.right - self.offset_x >= WIDTH - self.scroll_area_width) and player.x_vel > 0) or (
+            (player.rect.left - self.offset_x <= self.scroll_area_width) and player.x_vel < 0):
+            self.offset_x += player.x_vel
 
-    # Calculate time played
-    seconds = (pygame.time.get_ticks() - start_ticks) // 1000
-    timer_text = font.render(f"Time: {seconds}", True, (0,0,0))
-    win.blit(timer_text, (20, 100))
 
 # --- MAIN GAME FUNCTION ---
 
-# Sets up the level, loop, and game state
-def main(window):
+# Where the profiler writes its Chrome trace (F4, and on exit)
+TRACE_PATH = "aya-trace.json"
+
+
+# Opens the game in the window and runs it with keyboard input
+# dirty_rects=True only pushes the changed parts of the screen each frame
+# profile=True times every phase of the frame: F3 shows the timings on
+# screen, F4 saves a Chrome trace to TRACE_PATH (also saved on exit)
+# telemetry=True logs memory snapshots to TELEMETRY_PATH (see MemoryTelemetry),
+# with a full census every telemetry_census seconds if that is set
+# record=path saves each run's input to a Recording (path, then path-2, ...)
+# replay=Recording plays a recorded run back instead of reading the keyboard
+# render_fps caps how often the screen is drawn; the game logic itself
+# always runs FPS steps a second. level is a level dict (see load_level)
+def main(window=None, dirty_rects=False, profile=False, record=None, replay=None, render_fps=FPS, level=None,
+         telemetry=False, telemetry_census=0):
+    window = window or init()
+    preload_assets(window)
     clock = pygame.time.Clock()
     background, bg_image = get_background("pink.png")
+    if PIXEL > 1:
+        renderer = NativeRenderer(background, bg_image)
+    elif dirty_rects:
+        renderer = DirtyRenderer(background, bg_image)
+    else:
+        renderer = Renderer(background, bg_image)
+    profiler = FrameProfiler() if profile else NULL_PROFILER
+    telemetry = MemoryTelemetry(census_interval=int(telemetry_census * FPS)) if telemetry else NULL_TELEMETRY
+
+    game = Game(profiler=profiler, telemetry=telemetry, level=replay.level if replay else level)
+    runs = 0
+    recording = None
+    if record:
+        recording = Recording(game.level)
+        recording.begin()
+    elif replay:
+        replay.begin()
+
+    step_ms = 1000 / FPS
+    lag = 0.0 # Real time in ms the game logic hasn't caught up with yet
+    jumps = 0 # Jumps pressed since the last logic step
 
-    block_size = 96
-
-    player = Player(100, 100, 50, 50)
-
-    # --- LEVEL GENERATION START ---
-    floor = []
-    # Ground ranges: tuples of (start, end) blocks
-    ground_ranges = [(-2, 6), (9, 14), (17, 22), (26, 30), (34, 38), (42, 60)]
-
-    for start, end in ground_ranges:
-        for i in range(start, end):
-            floor.append(Block(i * block_size, HEIGHT - block_size, block_size))
-
-    # Create Floating Blocks for platforming
-    blocks = []
-    floating_blocks_coords = [
-        (7, 4), (8, 4), (15, 3), (23, 3), (24, 4), (31, 2), (32, 2), (39, 4), (40, 4)
-    ]
-    for x, height in floating_blocks_coords:
-        blocks.append(Block(x * block_size, HEIGHT - (block_size * height), block_size))
-
-    # Create Fire traps
-    fires = [
-        Fire(block_size * 3, HEIGHT - block_size - 64, 16, 32),
-        Fire(block_size * 12, HEIGHT - block_size - 64, 16, 32),
-        Fire(block_size * 20, HEIGHT - block_size - 64, 16, 32),
-        Fire(block_size * 45, HEIGHT - block_size - 64, 16, 32)
-    ]
-    for f in fires:
-        f.on()
-
-    # Create Enemies
-    enemies = [
-        Enemy(block_size * 44, HEIGHT - block_size - 64, 50, 50, block_size * 4),
-        Enemy(block_size * 18, HEIGHT - block_size - 64, 50, 50, block_size * 2)
-    ]
-    
-    projectiles = []
-
-    # Add everything to one list for drawing
-    objects = [*floor, *blocks, *fires]
-
-    treasure = None # Will be created when enemies are dead
-
-    offset_x = 0
-    scroll_area_width = 200
-    game_over = False
-    game_won = False 
-    score = 0 
-    start_ticks = pygame.time.get_ticks()
-
-    # Load and play background music
-    pygame.mixer.music.load("assets/sounds/background-music.mp3")
-    pygame.mixer.music.set_volume(0.3)
-    pygame.mixer.music.play(-1) # -1 means loop forever
-
-    # Load sound effects
-    lose_sound = pygame.mixer.Sound("assets/sounds/lose.mp3")
-    lose_sound.set_volume(0.7)
-    lose_played = False
-
-    jump_sound = pygame.mixer.Sound("assets/sounds/jump.mp3")
-    jump_sound.set_volume(0.6)
-
-    win_sound = pygame.mixer.Sound("assets/sounds/win.mp3")
-    win_sound.set_volume(0.7)
-    win_played = False
-    
-    damage_sound = pygame.mixer.Sound("assets/sounds/damage.mp3")
-    damage_sound.set_volume(0.6)  
-    player.damage_sound = damage_sound
-   
     run = True
     # --- MAIN LOOP ---
     while run:
-        clock.tick(FPS) # Maintain 60 FPS
+        lag += clock.tick(render_fps)
+        profiler.begin_frame()
 
         # Event Loop (Check for closing window or keys)
         for event in pygame.event.get():
@@ -571,98 +2095,46 @@ def main(window):
                 break
 
             if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_SPACE and player.jump_count < 2:
-                    player.jump()
-                    jump_sound.play()
-
-        player.loop(FPS)
-        
-        for f in fires:
-            f.loop()
-            
-        handle_move(player, objects)
-
-        # --- CHECK ENEMIES & TREASURE ---
-        alive_enemies = [e for e in enemies if e.lives > 0]
-        
-        # If all enemies are dead and treasure hasn't spawned yet, create it
-        if not alive_enemies and treasure is None:
-            # Create treasure at the end of the map (approx block 55)
-            treasure = Treasure(block_size * 55, HEIGHT - block_size - 96, 96)
-            objects.append(treasure) # Add to objects so it gets drawn
-
-        # --- ENEMY LOGIC ---
-        for enemy in enemies:
-            if enemy.lives > 0:
-                enemy.loop(FPS)
-                bullet = enemy.shoot()
-                if bullet:
-                    projectiles.append(bullet)
-
-                # Check collision: Player vs Enemy
-                if pygame.sprite.collide_mask(player, enemy):
-                    # Goomba Stomp logic (if falling on top of enemy)
-                    if player.y_vel > 0 and player.rect.bottom < enemy.rect.centery + 10:
-                        enemy.lives -= 1
-                        enemy.hit = True
-                        player.y_vel = -8
-                        player.jump_count = 1
-                        score += 100
-                    else:
-                        player.make_hit()
-
-        # Handle Projectiles (Bullets)
-        for bullet in projectiles[:]:
-            bullet.loop()
-            # If bullet hits player
-            if pygame.sprite.collide_rect(player, bullet):
-                player.make_hit()
-                projectiles.remove(bullet)
-            # Remove bullet if it goes off screen to save memory
-            elif bullet.rect.x > player.rect.x + 1000 or bullet.rect.x < player.rect.x - 1000:
-                if bullet in projectiles:
-                    projectiles.remove(bullet)
-
-        # --- CHECK WIN/LOSE CONDITIONS ---
-        
-        # 1. Lose Condition: Out of lives or fell in hole
-        if (player.lives <= 0 or player.rect.top > HEIGHT) and not game_over:
-            game_over = True
-            if not lose_played:
-                pygame.mixer.music.stop()
-                lose_sound.play()
-                lose_played = True
-        
-        # 2. Win Condition (Touching Treasure)
-        if treasure and pygame.sprite.collide_rect(player, treasure):
-            game_won = True
-            game_over = True # Stop the game loop logic
-
-            if not win_played:
-                pygame.mixer.music.stop()
-                win_sound.play()
-                win_played =True
+                if event.key == pygame.K_SPACE:
+                    jumps += 1
+                elif profile and event.key == pygame.K_F3:
+                    profiler.overlay = not profiler.overlay
+                elif profile and event.key == pygame.K_F4:
+                    profiler.export_chrome_trace(TRACE_PATH)
+        held = pygame.key.get_pressed()
+        profiler.lap("events")
+
+        # --- GAME LOGIC ---
+        # Fixed steps of 1/FPS seconds for however much time has passed: none
+        # on some frames when rendering faster than FPS, several when behind
+        steps = 0
+        while lag >= step_ms and steps < MAX_FRAME_SKIP:
+            if replay:
+                keys, jumps = replay.input(game.frame)
+            else:
+                keys = held
+            for _ in range(jumps):
+                game.jump()
+            if recording and recording.result is None:
+                recording.record(keys, jumps)
+            jumps = 0
+
+            game.step(keys)
+            game.update_camera()
+            if recording and recording.result is None and game.game_over:
+                recording.finish(game, recording_path(record, runs))
+            lag -= step_ms
+            steps += 1
+        if steps == MAX_FRAME_SKIP:
+            lag = min(lag, step_ms) # Too far behind, let the game slow down
 
         # --- DRAWING ---
-        for tile in background:
-            window.blit(bg_image, tile)
-        
-        for obj in objects:
-            obj.draw(window, offset_x)
-        
-        for enemy in enemies:
-            if enemy.lives > 0:
-                enemy.draw(window, offset_x)
-        
-        for bullet in projectiles:
-            bullet.draw(window, offset_x)
-        
-        player.draw(window, offset_x)
-        draw_hud(window, player, score, start_ticks)
+        game.draw(window, renderer, lag / step_ms)
 
         # --- GAME OVER / WIN SCREEN ---
-        if game_over:
-            if game_won:
+        if game.game_over:
+            renderer.invalidate() # The end screen covers everything
+            if game.game_won:
                 # WIN SCREEN 
                 window.fill((255, 204, 229)) 
                 msg = "YOU WIN!"
@@ -673,30 +2145,248 @@ def main(window):
                 msg = "GAME OVER"
                 color = (255, 255, 255)
 
-            font = pygame.font.SysFont("arial", 80)
-            text = font.render(msg, True, color)
+            font = assets.font("arial", 80)
+            text = texts.text(font, msg, color)
             window.blit(text, (WIDTH // 2 - text.get_width()//2, HEIGHT // 2 - 120))
 
             if button(window, "Restart",
                      WIDTH // 2 - 150, HEIGHT // 2 + 20, 300, 60):
-                main(window)
-                return
+                game.reset()
+                renderer.invalidate()
+                if recording:
+                    if recording.result is None:
+                        recording.finish(game, recording_path(record, runs))
+                    runs += 1
+                    recording = Recording(game.level)
+                    recording.begin()
+                elif replay:
+                    replay.begin()
 
             if button(window, "Exit",
                      WIDTH // 2 - 150, HEIGHT // 2 + 100, 300, 60):
-                pygame.quit()
-                quit()
+                run = False
+            profiler.lap("end_screen")
 
-        pygame.display.update()
+        if profiler.overlay:
+            renderer.mark(profiler.draw_overlay(window))
 
-        # Update scroll based on player position
-        # Keeps the player somewhat centered
-        if ((player.rect.right - offset_x >= WIDTH - scroll_area_width) and player.x_vel > 0) or (
-            (player.rect.left - offset_x <= scroll_area_width) and player.x_vel < 0):
-            offset_x += player.x_vel
+        renderer.present()
+        profiler.lap("flip")
+        profiler.end_frame()
+        telemetry.end_frame()
 
+    if profile:
+        profiler.export_chrome_trace(TRACE_PATH)
+    telemetry.close()
+    if recording and recording.result is None:
+        recording.finish(game, recording_path(record, runs))
     pygame.quit()
     quit()
 
+
+# --- HEADLESS SIMULATION ---
+
+# Scripted input for headless runs. frames is a list of (held keys, jump)
+# pairs, one per frame; once the script runs out nothing is pressed
+class ScriptedInput:
+    def __init__(self, frames):
+        self.frames = [(KeyState(held), jump) for held, jump in frames]
+
+    def __call__(self, frame, game):
+        if frame < len(self.frames):
+            return self.frames[frame]
+        return KeyState(), False
+
+
+# Runs one play-through with no drawing, no sound and no frame cap.
+# script(frame, game) returns (keys, jump) for each frame, e.g. a ScriptedInput
+# or a bot. If pygame isn't started yet this starts it with SDL's dummy
+# video/audio drivers, so it works on machines without a display
+# jump can also be a count, for frames where space was pressed more than once
+def run_headless(script, max_frames=FPS * 60, stop_on_game_over=True, level=None):
+    init(headless=True)
+    game = Game(sound=False, level=level)
+    while game.frame < max_frames:
+        keys, jump = script(game.frame, game)
+        for _ in range(int(jump)):
+            game.jump()
+        game.step(keys)
+        game.update_camera()
+        if game.game_over and stop_on_game_over:
+            break
+
+    return game.summary()
+
+
+# One frame of input packed into an int: bit 0 is LEFT held, bit 1 is RIGHT
+# held and the rest is how many times jump was pressed. Used by recordings
+# and as GameEnv actions
+INPUT_KEYS = (pygame.K_LEFT, pygame.K_RIGHT)
+INPUT_SHIFT = len(INPUT_KEYS)
+key_states = {} # held bits -> KeyState
+
+
+def encode_input(keys, jumps):
+    code = jumps << INPUT_SHIFT
+    for bit, key in enumerate(INPUT_KEYS):
+        if keys[key]:
+            code |= 1 << bit
+    return code
+
+
+# (keys, jumps) for an input code
+def decode_input(code):
+    held = code & ((1 << INPUT_SHIFT) - 1)
+    keys = key_states.get(held)
+    if keys is None:
+        keys = key_states[held] = KeyState(k for bit, k in enumerate(INPUT_KEYS) if held >> bit & 1)
+    return keys, code >> INPUT_SHIFT
+
+
+# One recorded run: the level, the seed `random` started from and the input
+# code for every frame up to the game over. Saved as JSON with the codes
+# run-length encoded as [code, frames] pairs, so holding a key for a while
+# is a single entry. result is the run's summary at the end, for checking
+# that a replay came out the same
+class Recording:
+    def __init__(self, level, seed=None, codes=None, result=None):
+        self.level = level
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self.codes = codes if codes is not None else []
+        self.result = result
+
+    # Seeds `random` the way it was when the run started
+    def begin(self):
+        random.seed(self.seed)
+
+    def record(self, keys, jumps):
+        self.codes.append(encode_input(keys, jumps))
+
+    # (keys, jumps) for a frame, like a headless script. Past the end of the
+    # recording nothing is pressed
+    def input(self, frame):
+        return decode_input(self.codes[frame] if frame < len(self.codes) else 0)
+
+    def __call__(self, frame, game):
+        return self.input(frame)
+
+    def finish(self, game, path):
+        self.result = game.summary()
+        self.save(path)
+
+    def save(self, path):
+        runs = []
+        for code in self.codes:
+            if runs and runs[-1][0] == code:
+                runs[-1][1] += 1
+            else:
+                runs.append([code, 1])
+        with open(path, "w") as f:
+            json.dump({"level": self.level, "seed": self.seed, "input": runs, "result": self.result}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        codes = [code for code, count in data["input"] for _ in range(count)]
+        return cls(parse_level(data["level"]), data["seed"], codes, data["result"])
+
+
+# Where run number `run` (from 0) of a recording session is saved
+def recording_path(path, run):
+    if run == 0:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}-{run + 1}{ext}"
+
+
+# Plays a recording back with no window, no sound and no frame cap. Returns
+# the same summary as run_headless, which should equal recording.result
+def replay_headless(recording):
+    recording.begin()
+    return run_headless(recording, max_frames=len(recording.codes), level=recording.level)
+
+
+# The game as an environment for bots and level balancing: reset() starts a
+# run and returns the first observation, step(action) plays one frame and
+# returns (observation, reward, done, info) like a gym environment. An
+# action is an input code, e.g. GameEnv.RIGHT | GameEnv.JUMP. The reward is
+# the score gained that frame and info is the run's summary. Each env has its
+# own Game, so any number can run side by side (see batch.py)
+class GameEnv:
+    LEFT, RIGHT, JUMP = 1, 2, 1 << INPUT_SHIFT
+
+    def __init__(self, level=None, max_frames=FPS * 60, seed=None):
+        init(headless=True)
+        self.game = Game(sound=False, level=level)
+        self.max_frames = max_frames
+        self.seed = seed
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.seed = seed
+        if self.seed is not None:
+            random.seed(self.seed)
+        self.game.reset()
+        return self.observe()
+
+    def step(self, action):
+        game = self.game
+        keys, jumps = decode_input(action)
+        for _ in range(jumps):
+            game.jump()
+        score = game.score
+        game.step(keys)
+        game.update_camera()
+        done = game.game_over or game.frame >= self.max_frames
+        return self.observe(), game.score - score, done, game.summary()
+
+    # Player rect, lives, score and frame, plus (x, y) arrays of the living
+    # enemies and the bullets in flight
+    def observe(self):
+        game = self.game
+        enemies = game.enemies
+        alive = enemies.lives[:enemies.count] > 0
+        bullets = game.projectiles
+        flying = bullets.alive[:bullets.count]
+        return {
+            "player": tuple(game.player.rect),
+            "lives": game.player.lives,
+            "score": game.score,
+            "frame": game.frame,
+            "enemies": np.column_stack((enemies.x[:enemies.count][alive], enemies.y[:enemies.count][alive])),
+            "projectiles": np.column_stack((bullets.x[:bullets.count][flying], bullets.y[:bullets.count][flying])),
+        }
+
+
+# Default headless script: keep running right and jump every 15 frames
+def demo_script(frame, game):
+    return KeyState([pygame.K_RIGHT]), frame % 15 == 0
+
+
+# Value given after a command line flag, e.g. option("--record") for
+# `--record run.json`. None if the flag isn't there
+def option(name):
+    if name in sys.argv[:-1]:
+        return sys.argv[sys.argv.index(name) + 1]
+    return None
+
+
 if __name__ == "__main__":
-    main(window)
\ No newline at end of file
+    replay = option("--replay")
+    level = load_level(option("--level")) if option("--level") else None
+    if HEADLESS:
+        if replay:
+            recording = Recording.load(replay)
+            result = replay_headless(recording)
+            print(result)
+            print("same as recorded" if result == recording.result else f"recorded: {recording.result}")
+        else:
+            print(run_headless(demo_script, level=level))
+    else:
+        main(init(), dirty_rects="--dirty-rects" in sys.argv,
+             profile="--profile" in sys.argv or os.environ.get("AYA_PROFILE") == "1",
+             record=option("--record"), replay=Recording.load(replay) if replay else None,
+             render_fps=int(option("--render-fps") or FPS), level=level,
+             telemetry="--telemetry" in sys.argv or os.environ.get("AYA_TELEMETRY") == "1",
+             telemetry_census=float(option("--telemetry-census") or 0))
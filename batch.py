@@ -0,0 +1,116 @@
+# Runs many headless games at once for level balancing and bot testing
+#
+# Every episode is one GameEnv run with its own seed and a simple policy
+# (the bot playing it). Episodes are spread over a process pool, one game per
+# worker process at a time, so throughput grows with the number of cores.
+# Per-episode results and an overall summary are written to a JSON file:
+#
+#   python batch.py --episodes 64 --policy random
+#   python batch.py --level levels/level1.json --workers 4 --out balance.json
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import aya
+
+
+# Policies map (frame, observation) to an action. Each factory gets the
+# episode's own Random, so an episode plays the same way every time
+
+# Run right and jump every 15 frames (the same as aya's demo script)
+def demo_policy(rng):
+    def act(frame, observation):
+        return aya.GameEnv.RIGHT | (aya.GameEnv.JUMP if frame % 15 == 0 else 0)
+    return act
+
+
+# Mostly run right, sometimes stop or turn back for a while, jump at random
+def random_policy(rng):
+    state = {"move": aya.GameEnv.RIGHT, "until": 0}
+
+    def act(frame, observation):
+        if frame >= state["until"]:
+            state["move"] = rng.choice([aya.GameEnv.RIGHT] * 6 + [aya.GameEnv.LEFT, 0])
+            state["until"] = frame + rng.randint(10, 60)
+        return state["move"] | (aya.GameEnv.JUMP if rng.random() < 0.07 else 0)
+    return act
+
+
+POLICIES = {"demo": demo_policy, "random": random_policy}
+
+# One env per worker process and level, reused across that worker's episodes
+envs = {}
+
+
+def run_episode(task):
+    seed, policy, level_path, max_frames = task
+    env = envs.get((level_path, max_frames))
+    if env is None:
+        env = envs[(level_path, max_frames)] = aya.GameEnv(aya.load_level(level_path), max_frames)
+
+    act = POLICIES[policy](random.Random(seed))
+    start = time.perf_counter()
+    observation = env.reset(seed)
+    frame = 0
+    done = False
+    while not done:
+        observation, reward, done, info = env.step(act(frame, observation))
+        frame += 1
+
+    info["seed"] = seed
+    info["seconds"] = time.perf_counter() - start
+    return info
+
+
+def mean(values):
+    return sum(values) / len(values) if values else 0.0
+
+
+def summarize(episodes, seconds):
+    frames = sum(e["frames"] for e in episodes)
+    return {
+        "episodes": len(episodes),
+        "win_rate": mean([e["won"] for e in episodes]),
+        "mean_frames": mean([e["frames"] for e in episodes]),
+        "mean_score": mean([e["score"] for e in episodes]),
+        "mean_lives_left": mean([e["lives"] for e in episodes]),
+        "mean_distance": mean([e["x"] for e in episodes]),
+        "wall_seconds": seconds,
+        "frames_per_second": frames / seconds if seconds else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run many headless aya.py games in parallel")
+    parser.add_argument("--episodes", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--policy", default="random", choices=list(POLICIES))
+    parser.add_argument("--level", default=aya.LEVEL_PATH, help="level JSON file")
+    parser.add_argument("--max-frames", type=int, default=aya.FPS * 60, help="frame limit per episode")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first episode")
+    parser.add_argument("--out", default="batch_results.json", help="where to write the JSON results")
+    args = parser.parse_args(argv)
+
+    tasks = [(args.seed + i, args.policy, args.level, args.max_frames) for i in range(args.episodes)]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        episodes = list(pool.map(run_episode, tasks))
+    seconds = time.perf_counter() - start
+
+    summary = summarize(episodes, seconds)
+    print(f"{summary['episodes']} episodes on {args.workers} workers: win rate {summary['win_rate']:.0%}, "
+          f"mean score {summary['mean_score']:.1f}, {summary['frames_per_second']:.0f} frames/s")
+
+    with open(args.out, "w") as f:
+        json.dump({"policy": args.policy, "level": args.level, "summary": summary, "episodes": episodes}, f, indent=2)
+    print(f"Results written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+# Frame-time benchmarks for aya.py
+#
+# Builds a few standard scenarios (the shipped level plus synthetic levels with
+# 10x and 100x the blocks, enemies, fires and bullets), plays each one with the
+# same fixed input script and times every subsystem of a frame. Results (mean,
+# p95 and p99 in milliseconds) are written to a JSON file so two builds can be
+# compared:
+#
+#   python bench.py --out before.json
+#   python bench.py --out after.json --compare before.json
+#
+# --sizes adds generated levels (see levelgen.py) of that many columns, for
+# charting frame time and memory against level size:
+#
+#   python bench.py --scenarios shipped --sizes 1000 10000 100000
+
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pygame
+
+import aya
+import levelgen
+
+try:
+    import resource # Unix only, for peak memory
+except ImportError:
+    resource = None
+
+# How many bullets each scenario keeps flying around the player on top of
+# the ones the enemies shoot
+SCENARIOS = {
+    "shipped": {"scale": 1, "bullets": 0},
+    "x10": {"scale": 10, "bullets": 100},
+    "x100": {"scale": 100, "bullets": 1000},
+}
+
+# Repeats a level `scale` times side by side. The treasure goes to the last copy
+def scale_level(level, scale):
+    start = min(s for s, _ in level["ground"])
+    end = max(e for _, e in level["ground"])
+    span = end - start
+    scaled = {"ground": [], "blocks": [], "fires": [], "enemies": []}
+    for k in range(scale):
+        shift = k * span
+        scaled["ground"] += [(s + shift, e + shift) for s, e in level["ground"]]
+        scaled["blocks"] += [(x + shift, h) for x, h in level["blocks"]]
+        scaled["fires"] += [x + shift for x in level["fires"]]
+        scaled["enemies"] += [(x + shift, patrol) for x, patrol in level["enemies"]]
+    scaled["treasure"] = level["treasure"] + (scale - 1) * span
+    return scaled
+
+
+# The fixed input script: run right, turn back left every fourth 90 frame
+# stretch and jump every 15 frames
+def script(frame):
+    left = (frame // 90) % 4 == 3
+    keys = aya.KeyState([pygame.K_LEFT if left else pygame.K_RIGHT])
+    return keys, frame % 15 == 0
+
+
+# Puts a fresh player back at the start after a game over, so long runs keep
+# exercising the level instead of timing a player falling forever
+def respawn(game):
+    game.player = aya.Player(100, 100, 50, 50)
+    game.player.damage_sound = game.damage_sound
+    game.offset_x = 0
+    game.game_over = game.game_won = False
+    game.lose_played = game.win_played = False
+
+
+# Keeps about `count` bullets in the air around the player
+def top_up_bullets(game, count, rng):
+    missing = count - len(game.projectiles)
+    if missing > 0:
+        px, py = game.player.rect.x, game.player.rect.y
+        game.projectiles.spawn_many(rng.integers(px - 900, px + 900, missing),
+                                    rng.integers(py - 300, py + 300, missing),
+                                    rng.choice([-1, 1], missing))
+
+
+def percentile(sorted_values, p):
+    index = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(samples):
+    values = sorted(samples)
+    return {
+        "mean_ms": sum(values) / len(values),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+        "max_ms": values[-1],
+    }
+
+
+# Peak resident memory of this process so far in KB, or None if unknown
+def max_rss_kb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def run_scenario(level, bullets, frames, window):
+    rng = np.random.default_rng(0)
+
+    # Game.step and Game.draw time their own phases on the profiler, so the
+    # subsystems timed here are always the ones the game really runs
+    profiler = aya.FrameProfiler(history=frames)
+
+    # Python and NumPy memory the level takes to build (surfaces live in SDL
+    # and aren't counted)
+    tracemalloc.start()
+    build_start = time.perf_counter()
+    game = aya.Game(sound=False, level=level, profiler=profiler)
+    build_ms = (time.perf_counter() - build_start) * 1000
+    build_bytes, build_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    background, bg_image = aya.get_background("pink.png")
+    renderer = (aya.NativeRenderer if aya.NATIVE else aya.Renderer)(background, bg_image)
+
+    for frame in range(frames):
+        keys, jump = script(frame)
+        if jump:
+            game.jump()
+        top_up_bullets(game, bullets, rng)
+
+        # One logic step and one draw, like a frame of main at FPS
+        profiler.begin_frame()
+        game.step(keys)
+        game.update_camera()
+        game.draw(window, renderer)
+        renderer.present()
+        profiler.lap("present")
+        profiler.end_frame()
+
+        if game.game_over:
+            respawn(game)
+
+    # Milliseconds per phase, in the order a frame runs them
+    samples = {}
+    totals = []
+    for recorded in profiler.frames:
+        for name, _, duration in recorded:
+            if name == "frame":
+                totals.append(duration * 1000)
+            else:
+                samples.setdefault(name, []).append(duration * 1000)
+
+    return {
+        "frames": frames,
+        "level": {
+            "blocks": sum(e - s for s, e in level["ground"]) + len(level["blocks"]),
+            "fires": len(level["fires"]),
+            "enemies": len(level["enemies"]),
+            "bullets": bullets,
+        },
+        "level_build_ms": build_ms,
+        "level_build_bytes": build_bytes,
+        "level_build_peak_bytes": build_peak,
+        "max_rss_kb": max_rss_kb(),
+        "frame": summarize(totals),
+        "subsystems": {sub: summarize(values) for sub, values in samples.items()},
+    }
+
+
+# Time to load the sprite sheets from disk (asset cache cleared each time),
+# once slicing and scaling every frame and once from the on-disk atlas
+def time_startup(repeats):
+    results = {}
+    for name, atlas in (("load_sprite_sheets", False), ("load_sprite_sheets_atlas", True)):
+        samples = []
+        for _ in range(repeats):
+            aya.assets.clear()
+            start = time.perf_counter()
+            aya.load_sprite_sheets("MainCharacters", "Man", 32, 32, True, atlas=atlas)
+            aya.load_sprite_sheets("MainCharacters", "bad_guy", 32, 32, True, atlas=atlas)
+            aya.load_sprite_sheets("Traps", "Fire", 16, 32, atlas=atlas)
+            samples.append((time.perf_counter() - start) * 1000)
+        results[name] = summarize(samples)
+    return results
+
+
+# Prints how each scenario's frame times moved against an older result file.
+# Returns False if any p95 got slower than `threshold` times the old one
+def compare(results, baseline, threshold):
+    ok = True
+    for name, scenario in results["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old is None:
+            continue
+        for key in ("mean_ms", "p95_ms", "p99_ms"):
+            before, after = old["frame"][key], scenario["frame"][key]
+            ratio = after / before if before else float("inf")
+            flag = ""
+            if key == "p95_ms" and ratio > threshold:
+                flag = "  REGRESSION"
+                ok = False
+            print(f"{name:>8} {key:>8}: {before:8.3f} -> {after:8.3f} ms ({ratio:5.2f}x){flag}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Frame-time benchmarks for aya.py")
+    parser.add_argument("--frames", type=int, default=600, help="frames to play per scenario")
+    parser.add_argument("--scenarios", nargs="*", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--sizes", nargs="*", type=int, default=[],
+                        help="also run generated levels with these many columns")
+    parser.add_argument("--startup-repeats", type=int, default=5)
+    parser.add_argument("--native", action="store_true", help="native resolution mode (1x art, half-size canvas)")
+    parser.add_argument("--out", default="bench_results.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="older results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="p95 slowdown ratio that counts as a regression")
+    args = parser.parse_args(argv)
+
+    # Dummy display and audio, but not headless mode: that skips building
+    # things only drawing needs, and the benchmark draws every frame
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    window = aya.init(headless=False, native=args.native)
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "frames": args.frames,
+            "native": args.native,
+        },
+        "startup": time_startup(args.startup_repeats),
+        "scenarios": {},
+    }
+    # Start the scenarios from a cold cache so surface_classes counts each
+    # surface they use once, not once per startup repeat
+    aya.assets.clear()
+    for kind in aya.surface_classes:
+        aya.surface_classes[kind] = 0
+    levels = [(name, scale_level(aya.load_level(), SCENARIOS[name]["scale"]), SCENARIOS[name]["bullets"])
+              for name in args.scenarios]
+    levels += [(f"gen-{size}", levelgen.generate(size, seed=0), 0) for size in args.sizes]
+    for name, level, bullets in levels:
+        results["scenarios"][name] = run_scenario(level, bullets, args.frames, window)
+        frame = results["scenarios"][name]["frame"]
+        print(f"{name:>8}: mean {frame['mean_ms']:.3f} ms, p95 {frame['p95_ms']:.3f} ms, "
+              f"p99 {frame['p99_ms']:.3f} ms")
+
+    # How the loaded surfaces are stored for blitting (see aya.optimize_surface)
+    results["surface_classes"] = dict(aya.surface_classes)
+    print("surfaces: " + ", ".join(f"{count} {kind}" for kind, count in aya.surface_classes.items()))
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
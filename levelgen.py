@@ -0,0 +1,103 @@
+# Seeded procedural levels for aya.py
+#
+# Builds levels in the same format as the JSON files in levels/ (see
+# aya.load_level): runs of ground with gaps, floating platforms over the
+# wider gaps, fires and patrolling enemies on the ground, and the treasure
+# on a safe stretch of ground at the end. The same seed always gives the same
+# level, so generated levels work as benchmark fixtures:
+#
+#   python levelgen.py --columns 10000 --seed 3 --out levels/long.json
+#   python aya.py --level levels/long.json
+
+import argparse
+import json
+import random
+import sys
+
+# Gaps up to this many columns can be jumped from ground to ground. Wider
+# ones (up to MAX_GAP) always get a platform to jump onto on the way
+JUMPABLE_GAP = 3
+MAX_GAP = 4
+# Platforms are between these many rows up from the bottom (ground is row 1).
+# The highest one is still in reach of a single jump from the ground
+PLATFORM_ROWS = (2, 4)
+# Columns at the start and end of the level with nothing dangerous on them
+SAFE_START = 8
+SAFE_END = 8
+
+
+# A level `columns` blocks long. density (0 to 1) sets how short the runs of
+# ground are and how often gaps get extra platforms, fires and enemies appear
+def generate(columns, seed=0, density=0.5):
+    rng = random.Random(seed)
+    level = {"ground": [], "blocks": [], "fires": [], "enemies": []}
+    columns = max(columns, SAFE_START + SAFE_END)
+    longest_run = max(4, round(14 - 8 * density))
+
+    start, end = -2, SAFE_START
+    while True:
+        if end >= columns - SAFE_END - 3:
+            # Last stretch: ground to the end of the level, treasure near the end
+            level["ground"].append((start, columns))
+            populate(level, rng, density, max(start, SAFE_START), columns - SAFE_END)
+            break
+
+        level["ground"].append((start, end))
+        populate(level, rng, density, max(start, SAFE_START), end)
+
+        gap = rng.randint(1, MAX_GAP if rng.random() < density else JUMPABLE_GAP)
+        if gap > JUMPABLE_GAP or (gap > 1 and rng.random() < density):
+            # Platform over the middle of the gap
+            rows = rng.randint(*PLATFORM_ROWS)
+            width = rng.randint(1, gap - 1) if gap > 2 else 1
+            first = end + (gap - width + 1) // 2
+            level["blocks"] += [(x, rows) for x in range(first, first + width)]
+
+        start = end + gap
+        end = start + rng.randint(3, longest_run)
+
+    level["treasure"] = columns - 3
+    return level
+
+
+# Fires and enemies on the ground run [start, end). Enemies stay off the
+# run's first and last column and fires off the first and last two, so there
+# is always room to land after a jump
+def populate(level, rng, density, start, end):
+    length = end - start
+    if length < 3:
+        return
+
+    if length >= 5 and rng.random() < density * 0.6:
+        patrol = rng.randint(1, min(4, length - 4))
+        level["enemies"].append((rng.randint(start + 1, end - 2 - patrol), patrol))
+
+    last_fire = None
+    for x in range(start + 2, end - 2):
+        if last_fire != x - 1 and rng.random() < density * 0.12:
+            level["fires"].append(x)
+            last_fire = x
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a level for aya.py")
+    parser.add_argument("--columns", type=int, default=200, help="level length in blocks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--density", type=float, default=0.5, help="0 (sparse) to 1 (dense)")
+    parser.add_argument("--out", default="-", help="JSON file to write (- for stdout)")
+    args = parser.parse_args(argv)
+
+    level = generate(args.columns, args.seed, args.density)
+    if args.out == "-":
+        json.dump(level, sys.stdout)
+        print()
+    else:
+        with open(args.out, "w") as f:
+            json.dump(level, f)
+        tiles = sum(e - s for s, e in level["ground"]) + len(level["blocks"])
+        print(f"{tiles} tiles, {len(level['fires'])} fires, {len(level['enemies'])} enemies -> {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())